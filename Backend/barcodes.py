@@ -0,0 +1,121 @@
+"""
+Barcodes (GTIN / EAN) and retailer SKUs from scraped product data.
+
+None of the scrapers export these as fields, but the retailers put them
+in their URLs:
+
+- Pick n Pay image files embed the EAN:
+  `.../silo-product-image-v2-...-6001299015205-Straight_on-...`
+  and product URLs end in the PnP article code: `/p/000000000000203520_EA`
+- Woolworths product URLs and image files carry the EAN:
+  `.../_/A-6001424000021`, `...-100-ml-6001424000021.jpg`
+- Checkers and Shoprite product URLs end in the group-wide SKU:
+  `...-12-pack-10689259EA`, `/p/10156109PK1`
+
+Barcodes are only accepted when their GS1 check digit is valid, so
+timestamps and storage ids in the same URLs are not mistaken for one.
+"""
+import re
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from search_index import normalize
+
+# URL host suffix -> patterns whose first group is a barcode
+_GTIN_PATTERNS = {
+    "woolworths.co.za": (re.compile(r"/_/A-(\d{8,14})$"),),
+    "woolworthsstatic.co.za": (re.compile(r"-(\d{8,14})\.(?:jpe?g|png|webp)$", re.IGNORECASE),),
+    "pnp.co.za": (re.compile(r"-(\d{8,14})-Straight_on", re.IGNORECASE),),
+}
+_SKU_PATTERNS = (
+    # Pick n Pay: /p/000000000000203520_EA
+    re.compile(r"/p/(\d+_[A-Z]+)$"),
+    # Checkers / Shoprite: /p/10156109PK1 or a slug ending -10689259EA
+    re.compile(r"[/-](\d{6,}(?:EA|KG|CS|PK\d*))$"),
+    # Woolworths: /_/A-6001424000021
+    re.compile(r"/_/A-(\w+)$"),
+)
+
+# Retailers sharing one SKU catalogue; an equal SKU there is the same product
+SKU_NAMESPACES = {"checkers": "shoprite-group", "shoprite": "shoprite-group"}
+
+
+def gtin_check_digit_ok(digits: str) -> bool:
+    """GS1 mod-10 check: weights 3,1,3,... from the right, excluding the check digit."""
+    body, check = digits[:-1], int(digits[-1])
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def normalize_gtin(value) -> Optional[str]:
+    """Canonical barcode: EAN-8 / UPC-A / EAN-13 / GTIN-14 as 13 digits
+    (14 only for GTIN-14s with a packaging indicator), or None if invalid."""
+    if value is None:
+        return None
+    digits = re.sub(r"[\s-]", "", str(value))
+    if not digits.isdigit() or len(digits) not in (8, 12, 13, 14):
+        return None
+    if not gtin_check_digit_ok(digits):
+        return None
+    digits = digits.zfill(14)
+    return digits[1:] if digits.startswith("0") else digits
+
+
+def _split(url: Optional[str]) -> Tuple[str, str]:
+    """(host, unquoted path) of a URL."""
+    if not url:
+        return "", ""
+    parts = urlsplit(str(url).strip())
+    return (parts.hostname or ""), unquote(parts.path).rstrip("/")
+
+
+def _gtin_patterns(host: str):
+    for suffix, patterns in _GTIN_PATTERNS.items():
+        if host == suffix or host.endswith("." + suffix):
+            return patterns
+    return ()
+
+
+def extract_gtin(doc: dict) -> Optional[str]:
+    """Barcode of a product: a scraped `gtin` field, else one found in its URLs."""
+    gtin = normalize_gtin(doc.get("gtin"))
+    if gtin:
+        return gtin
+    for url in (doc.get("productURL"), doc.get("productImageURL")):
+        host, path = _split(url)
+        for pattern in _gtin_patterns(host):
+            match = pattern.search(path)
+            if match:
+                gtin = normalize_gtin(match.group(1))
+                if gtin:
+                    return gtin
+    return None
+
+
+def extract_sku(doc: dict) -> Optional[str]:
+    """Retailer's own product code: a scraped `sku` field, else from the product URL."""
+    if doc.get("sku"):
+        return str(doc["sku"]).strip().upper()
+    _, path = _split(doc.get("productURL"))
+    for pattern in _SKU_PATTERNS:
+        match = pattern.search(path)
+        if match:
+            return match.group(1).upper()
+    return None
+
+
+def sku_namespace(retailer_key: Optional[str]) -> Optional[str]:
+    """Scope in which a SKU identifies one product (usually the retailer)."""
+    if not retailer_key:
+        return None
+    return SKU_NAMESPACES.get(retailer_key, retailer_key)
+
+
+def exact_key(doc: dict) -> Optional[str]:
+    """Identity shared by exactly-equal products across retailers, if known."""
+    if doc.get("gtin"):
+        return f"gtin:{doc['gtin']}"
+    namespace = sku_namespace(doc.get("retailer_key") or normalize(doc.get("retailer")))
+    if doc.get("sku") and namespace:
+        return f"sku:{namespace}:{doc['sku']}"
+    return None
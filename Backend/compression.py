@@ -0,0 +1,146 @@
+"""
+Response compression (brotli / gzip) with content negotiation.
+
+Cached catalog responses are compressed once per encoding and kept with
+the cache entry (see `encode_cached`); everything else passes through
+`CompressionMiddleware`, which compresses JSON/text bodies above a size
+threshold. Images are left alone, they are already compressed. brotli is
+optional: without it only gzip is offered.
+"""
+import gzip
+import os
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Cached bodies are compressed once per catalog version, so they can
+# afford a higher quality than per-request responses
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+BROTLI_CACHED_QUALITY = int(os.getenv("BROTLI_CACHED_QUALITY", "9"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+# Server preference when the client accepts several with the same q
+_PREFERENCE = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best encoding the client accepts (by q-value, then our preference)."""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for coding in _PREFERENCE:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_CACHED_QUALITY if cached else BROTLI_QUALITY)
+    # mtime=0 makes the output deterministic for equal bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """Strong ETags name one byte sequence, so each encoding gets its own."""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def encode_cached(body: bytes, encoded: Dict[str, bytes], accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """(body, encoding) for a cached response, compressing at most once per encoding.
+
+    `encoded` is the cache entry's store of compressed bodies.
+    """
+    encoding = choose_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is None:
+        return body, None
+    compressed = encoded.get(encoding)
+    if compressed is None:
+        compressed = encoded[encoding] = compress(body, encoding, cached=True)
+    return compressed, encoding
+
+
+def _compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing JSON/text responses the client can decode.
+
+    Only compressible responses are buffered; images, files and anything
+    already encoded stream through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        start_message = None
+        chunks = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if not _compressible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if encoding and len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -2,10 +2,11 @@ from sqlalchemy.orm import Session
 import models
 from typing import List, Optional
 import os
-import json
 import glob
 import re
 
+from json_stream import iter_json_records
+
 
 def get_product(db: Session, product_id: int) -> Optional[models.Product]:
     return db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -50,53 +51,49 @@ def seed_data(db: Session):
     files = glob.glob(pattern)
 
     for filepath in files:
+        # stream records (arrays, wrapped arrays or JSON Lines) instead of
+        # loading the whole file
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            continue
-
-        if not isinstance(data, list):
-            # maybe the file has an object with list under a key
-            if isinstance(data, dict):
-                # attempt to find a list value
-                for v in data.values():
-                    if isinstance(v, list):
-                        data = v
-                        break
-
-        for item in data:
-            name = item.get("name") or item.get("productName") or item.get("title")
-            if not name:
-                continue
-            price = _parse_price(item.get("price") or item.get("price_str"))
-            image = item.get("image") or item.get("image_url") or item.get("img")
-            buy = item.get("buy_url") or item.get("url") or item.get("product_url")
-            category_name = item.get("category") or item.get("department") or "Uncategorized"
-
-            # ensure category exists
-            category = db.query(models.Category).filter(models.Category.name == category_name).first()
-            if not category:
-                category = models.Category(name=category_name)
-                db.add(category)
-                db.commit()
-                db.refresh(category)
-
-            # avoid duplicates by name + buy_url
-            q = db.query(models.Product).filter(models.Product.name == name)
-            if buy:
-                q = q.filter(models.Product.buy_url == buy)
-            exists = q.first()
-            if exists:
-                continue
-
-            prod = models.Product(
-                name=name,
-                price=price,
-                image_url=image,
-                buy_url=buy,
-                category_id=category.id,
-            )
-            db.add(prod)
+            for item in iter_json_records(filepath):
+                _seed_item(db, item)
+        except (OSError, ValueError):
+            pass
         # commit after processing file
         db.commit()
+
+
+def _seed_item(db: Session, item: dict):
+    if not isinstance(item, dict):
+        return
+    name = item.get("name") or item.get("productName") or item.get("title")
+    if not name:
+        return
+    price = _parse_price(item.get("price") or item.get("price_str"))
+    image = item.get("image") or item.get("image_url") or item.get("img")
+    buy = item.get("buy_url") or item.get("url") or item.get("product_url")
+    category_name = item.get("category") or item.get("department") or "Uncategorized"
+
+    # ensure category exists
+    category = db.query(models.Category).filter(models.Category.name == category_name).first()
+    if not category:
+        category = models.Category(name=category_name)
+        db.add(category)
+        db.commit()
+        db.refresh(category)
+
+    # avoid duplicates by name + buy_url
+    q = db.query(models.Product).filter(models.Product.name == name)
+    if buy:
+        q = q.filter(models.Product.buy_url == buy)
+    exists = q.first()
+    if exists:
+        return
+
+    prod = models.Product(
+        name=name,
+        price=price,
+        image_url=image,
+        buy_url=buy,
+        category_id=category.id,
+    )
+    db.add(prod)
@@ -0,0 +1,321 @@
+"""
+Local content cache for proxied product images.
+
+Images are stored on disk keyed by a hash of their upstream URL and evicted
+least-recently-used once the cache exceeds its byte budget. Small images
+(thumbnails) are also kept in an in-memory hot tier. Entries older than the
+TTL are revalidated upstream with their ETag / Last-Modified validators.
+
+Workers share the directory, so each one periodically rescans it: the byte
+budget then covers every worker's files, and entries another worker evicted
+are dropped. A body can still vanish between a lookup and a read; callers
+treat that as a miss (see `read_body` / `has_body`).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".image_cache")
+)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(24 * 3600)))
+IMAGE_MEMORY_MAX_BYTES = int(os.getenv("IMAGE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+IMAGE_MEMORY_ITEM_MAX_BYTES = int(os.getenv("IMAGE_MEMORY_ITEM_MAX_BYTES", str(64 * 1024)))
+# How often a worker re-reads the shared directory to see other workers' files
+IMAGE_CACHE_RESCAN_SECONDS = int(os.getenv("IMAGE_CACHE_RESCAN_SECONDS", "60"))
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedImage:
+    key: str
+    url: str
+    content_type: str
+    size: int
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Content hash, used as the strong ETag sent to our own clients
+    digest: Optional[str] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.fetched_at < IMAGE_CACHE_TTL
+
+    @property
+    def client_etag(self) -> str:
+        return f'"{self.digest or self.key[:32]}"'
+
+
+class ImageCache:
+    """Size-bounded LRU cache on disk with an in-memory hot tier."""
+
+    def __init__(
+        self,
+        directory: str = IMAGE_CACHE_DIR,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        memory_max_bytes: int = IMAGE_MEMORY_MAX_BYTES,
+        rescan_seconds: int = IMAGE_CACHE_RESCAN_SECONDS,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.rescan_seconds = rescan_seconds
+        self._scanned_at = 0.0
+        # key -> entry, least recently used first
+        self._entries: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._disk_bytes = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+
+    # --- Paths ---
+
+    def body_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _meta_path(self, key: str) -> str:
+        return self.body_path(key) + ".json"
+
+    def temp_path(self, url: str) -> str:
+        """Scratch file for a download in progress (renamed into place by put_file)."""
+        key = cache_key(url)
+        directory = os.path.dirname(self.body_path(key))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{key}.{uuid.uuid4().hex}.part")
+
+    # --- Startup ---
+
+    def load(self) -> int:
+        """Rebuild the LRU index from files on disk (oldest first)."""
+        self._apply_scan(self._scan())
+        return len(self._entries)
+
+    async def rescan(self) -> int:
+        """`load` without blocking the event loop, then enforce the budget."""
+        self._apply_scan(await asyncio.to_thread(self._scan))
+        await self._evict()
+        return len(self._entries)
+
+    def _scan(self) -> list:
+        found = []
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".part", ".tmp")):
+                    # Left behind by an interrupted download or write
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except OSError:
+                        pass
+                    continue
+                if not name.endswith(".json"):
+                    continue
+                meta_path = os.path.join(root, name)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        entry = CachedImage(**json.load(f))
+                    mtime = os.path.getmtime(self.body_path(entry.key))
+                except Exception:
+                    continue
+                found.append((mtime, entry))
+        return sorted(found, key=lambda pair: pair[0])
+
+    def _apply_scan(self, found: list):
+        self._entries.clear()
+        self._disk_bytes = 0
+        for _, entry in found:
+            self._entries[entry.key] = entry
+            self._disk_bytes += entry.size
+        for key in [key for key in self._memory if key not in self._entries]:
+            self._drop_memory(key)
+        self._scanned_at = time.monotonic()
+
+    # --- Reads ---
+
+    def lookup(self, url: str) -> Optional[CachedImage]:
+        entry = self._entries.get(cache_key(url))
+        if entry is not None:
+            self._entries.move_to_end(entry.key)
+        return entry
+
+    def memory_body(self, key: str) -> Optional[bytes]:
+        body = self._memory.get(key)
+        if body is not None:
+            self._memory.move_to_end(key)
+        return body
+
+    async def read_body(self, entry: CachedImage) -> Optional[bytes]:
+        """Body bytes from the hot tier, or from disk (promoting small ones)."""
+        body = self.memory_body(entry.key)
+        if body is not None:
+            return body
+        try:
+            body = await asyncio.to_thread(_read_file, self.body_path(entry.key))
+        except OSError:
+            self._forget(entry.key)
+            return None
+        self._remember(entry.key, body)
+        return body
+
+    async def has_body(self, entry: CachedImage) -> bool:
+        """Whether the entry's file is still on disk; forgets the entry if not."""
+        if await asyncio.to_thread(os.path.exists, self.body_path(entry.key)):
+            return True
+        self._forget(entry.key)
+        return False
+
+    # --- Writes ---
+
+    async def put(
+        self,
+        url: str,
+        body: bytes,
+        content_type: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedImage:
+        entry = CachedImage(
+            key=cache_key(url),
+            url=url,
+            content_type=content_type,
+            size=len(body),
+            fetched_at=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+            digest=hashlib.sha256(body).hexdigest()[:32],
+        )
+        await asyncio.to_thread(self._write, entry, body)
+        return await self._track(entry, body)
+
+    async def put_file(
+        self,
+        url: str,
+        temp_path: str,
+        size: int,
+        digest: str,
+        content_type: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedImage:
+        """Adopt a fully downloaded temp file as the cache entry for `url`."""
+        entry = CachedImage(
+            key=cache_key(url),
+            url=url,
+            content_type=content_type,
+            size=size,
+            fetched_at=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+            digest=digest,
+        )
+        body = await asyncio.to_thread(self._adopt, entry, temp_path)
+        return await self._track(entry, body)
+
+    async def _track(self, entry: CachedImage, body: Optional[bytes]) -> CachedImage:
+        previous = self._entries.pop(entry.key, None)
+        if previous is not None:
+            self._disk_bytes -= previous.size
+            self._drop_memory(entry.key)
+        self._entries[entry.key] = entry
+        self._disk_bytes += entry.size
+        if body is not None:
+            self._remember(entry.key, body)
+
+        if time.monotonic() - self._scanned_at >= self.rescan_seconds:
+            await self.rescan()
+        else:
+            await self._evict()
+        return entry
+
+    async def mark_revalidated(self, entry: CachedImage) -> CachedImage:
+        """Upstream answered 304: extend the entry's freshness."""
+        entry.fetched_at = time.time()
+        await asyncio.to_thread(_write_json, self._meta_path(entry.key), asdict(entry))
+        return entry
+
+    def _adopt(self, entry: CachedImage, temp_path: str) -> Optional[bytes]:
+        """Move a downloaded file into place; return its bytes if hot-tier sized."""
+        os.replace(temp_path, self.body_path(entry.key))
+        _write_json(self._meta_path(entry.key), asdict(entry))
+        if entry.size <= IMAGE_MEMORY_ITEM_MAX_BYTES:
+            return _read_file(self.body_path(entry.key))
+        return None
+
+    def _write(self, entry: CachedImage, body: bytes):
+        path = self.body_path(entry.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        _write_json(self._meta_path(entry.key), asdict(entry))
+
+    async def _evict(self):
+        victims = []
+        while self._disk_bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._disk_bytes -= entry.size
+            self._drop_memory(key)
+            victims.append(key)
+        if victims:
+            await asyncio.to_thread(self._unlink, victims)
+
+    def _unlink(self, keys):
+        for key in keys:
+            for path in (self.body_path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry.size
+        self._drop_memory(key)
+
+    # --- Memory tier ---
+
+    def _remember(self, key: str, body: bytes):
+        if len(body) > IMAGE_MEMORY_ITEM_MAX_BYTES or key in self._memory:
+            return
+        self._memory[key] = body
+        self._memory_bytes += len(body)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _drop_memory(self, key: str):
+        body = self._memory.pop(key, None)
+        if body is not None:
+            self._memory_bytes -= len(body)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "disk_bytes": self._disk_bytes,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
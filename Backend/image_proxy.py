@@ -0,0 +1,442 @@
+"""
+Upstream image fetching for the /image proxy.
+
+A single httpx.AsyncClient is shared by every request (opened and closed by
+the app's startup/shutdown hooks) so product grids reuse a few keep-alive
+connections per retailer CDN instead of paying a TCP+TLS handshake per image.
+Fetched images go through the local ImageCache, so repeat views of a product
+grid are served from disk or memory without touching the retailer CDNs.
+Concurrent misses for the same URL share one upstream fetch (single-flight).
+Upstream bodies are streamed to the cache in chunks, so memory per download
+stays bounded whatever the image size.
+
+Failures are remembered: broken URLs sit in a short-TTL negative cache and
+each CDN host has a circuit breaker, so a dead link or a degraded retailer
+CDN fails fast instead of tying up a worker for the full timeout.
+
+Resized / WebP variants are produced once in a process pool from the cached
+original and stored in the same cache under a variant key.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import image_variants
+from image_cache import CachedImage, ImageCache
+from single_flight import SingleFlight
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IMAGE_MAX_CONNECTIONS = int(os.getenv("IMAGE_MAX_CONNECTIONS", "64"))
+IMAGE_MAX_KEEPALIVE = int(os.getenv("IMAGE_MAX_KEEPALIVE", "32"))
+IMAGE_MAX_CONNECTIONS_PER_HOST = int(os.getenv("IMAGE_MAX_CONNECTIONS_PER_HOST", "8"))
+IMAGE_KEEPALIVE_EXPIRY = float(os.getenv("IMAGE_KEEPALIVE_EXPIRY", "60"))
+
+# Largest upstream image we are willing to relay, and the read chunk size
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Failure memory: how long a broken URL is skipped, and when a host trips
+IMAGE_NEGATIVE_TTL = int(os.getenv("IMAGE_NEGATIVE_TTL", "600"))
+IMAGE_NEGATIVE_TTL_TRANSIENT = int(os.getenv("IMAGE_NEGATIVE_TTL_TRANSIENT", "60"))
+IMAGE_NEGATIVE_MAX_ENTRIES = int(os.getenv("IMAGE_NEGATIVE_MAX_ENTRIES", "10000"))
+IMAGE_BREAKER_THRESHOLD = int(os.getenv("IMAGE_BREAKER_THRESHOLD", "5"))
+IMAGE_BREAKER_COOLDOWN = float(os.getenv("IMAGE_BREAKER_COOLDOWN", "30"))
+
+IMAGE_TRANSCODE_WORKERS = int(os.getenv("IMAGE_TRANSCODE_WORKERS", "2"))
+
+IMAGE_TIMEOUT = httpx.Timeout(
+    connect=float(os.getenv("IMAGE_CONNECT_TIMEOUT", "3")),
+    read=float(os.getenv("IMAGE_READ_TIMEOUT", "10")),
+    write=5.0,
+    pool=float(os.getenv("IMAGE_POOL_TIMEOUT", "5")),
+)
+
+
+
+class NegativeCache:
+    """URLs that recently failed, each with its own expiry time."""
+
+    def __init__(self, max_entries: int = IMAGE_NEGATIVE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, url: str, ttl: float):
+        self._expiry.pop(url, None)
+        self._expiry[url] = time.monotonic() + ttl
+        while len(self._expiry) > self.max_entries:
+            self._expiry.popitem(last=False)
+
+    def __contains__(self, url: str) -> bool:
+        expires = self._expiry.get(url)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._expiry[url]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after consecutive failures, probes after a cooldown."""
+
+    def __init__(self, threshold: int = IMAGE_BREAKER_THRESHOLD, cooldown: float = IMAGE_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        # host -> when its half-open probe started
+        self._probing: Dict[str, float] = {}
+
+    def allow(self, host: str) -> bool:
+        opened_at = self._opened_at.get(host)
+        if opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - opened_at < self.cooldown:
+            return False
+        # Half-open: let one request through to test the host (a new one if
+        # the previous probe never reported back)
+        probe_started = self._probing.get(host)
+        if probe_started is not None and now - probe_started < self.cooldown:
+            return False
+        self._probing[host] = now
+        return True
+
+    def record_success(self, host: str):
+        self._failures.pop(host, None)
+        self._opened_at.pop(host, None)
+        self._probing.pop(host, None)
+
+    def record_failure(self, host: str):
+        self._probing.pop(host, None)
+        failures = self._failures.get(host, 0) + 1
+        self._failures[host] = failures
+        if failures >= self.threshold:
+            if host not in self._opened_at:
+                print(f"⚡ Image host {host} is failing; circuit opened for {self.cooldown:.0f}s")
+            self._opened_at[host] = time.monotonic()
+
+    def open_hosts(self):
+        return sorted(self._opened_at)
+
+
+_client: Optional[httpx.AsyncClient] = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+image_cache = ImageCache()
+negative_cache = NegativeCache()
+breaker = CircuitBreaker()
+
+# Created on first use so workers are only spawned if variants are requested
+_transcode_pool: Optional[ProcessPoolExecutor] = None
+
+# Counters exposed through /debug/image-stats
+proxy_stats = {
+    "requests": 0,
+    "cache_hits": 0,
+    "upstream_fetches": 0,
+    "coalesced": 0,
+    "negative_hits": 0,
+    "breaker_rejections": 0,
+    "variants_generated": 0,
+}
+
+# Upstream fetches and variant builds currently running, by URL / variant key
+_inflight = SingleFlight(proxy_stats)
+
+
+async def start_client():
+    """Create the shared upstream client and load the disk cache (app startup)."""
+    global _client
+    cached = await asyncio.to_thread(image_cache.load)
+    print(f"🖼️ Image cache ready with {cached} entries.")
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=IMAGE_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=IMAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=IMAGE_MAX_KEEPALIVE,
+                keepalive_expiry=IMAGE_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+
+async def close_client():
+    """Close pooled connections and the transcode workers (app shutdown)."""
+    global _client, _transcode_pool
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _transcode_pool is not None:
+        _transcode_pool.shutdown(wait=False, cancel_futures=True)
+        _transcode_pool = None
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Image client not started; call start_client() on startup")
+    return _client
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def host_slot(url: str) -> asyncio.Semaphore:
+    """Per-host concurrency cap so one slow CDN cannot take the whole pool."""
+    host = host_of(url)
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(IMAGE_MAX_CONNECTIONS_PER_HOST)
+    return slot
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+@dataclass
+class Download:
+    """Outcome of one upstream GET (a 304, or a body written to `path`)."""
+    status: int
+    path: Optional[str] = None
+    size: int = 0
+    digest: Optional[str] = None
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# Leading bytes of the formats retailer CDNs serve
+_MAGIC_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+)
+
+
+def sniff_content_type(declared: Optional[str], head: bytes) -> Optional[str]:
+    """Trust an image/* Content-Type, otherwise recognise the bytes."""
+    media_type = (declared or "").split(";")[0].strip().lower()
+    if media_type.startswith("image/"):
+        return media_type
+    for magic, sniffed in _MAGIC_TYPES:
+        if head.startswith(magic) and (sniffed != "image/webp" or head[8:12] == b"WEBP"):
+            return sniffed
+    return None
+
+
+async def download(
+    url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> Optional[Download]:
+    """Stream an image upstream into a cache temp file.
+
+    Sends a conditional GET when validators are given. Returns None for
+    errors, non-image bodies and bodies over IMAGE_MAX_BYTES.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    proxy_stats["upstream_fetches"] += 1
+    host = host_of(url)
+    temp_path = image_cache.temp_path(url)
+    f = None
+    handed_off = False
+    try:
+        async with host_slot(url):
+            async with get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    breaker.record_success(host)
+                    return Download(status=304)
+                if response.status_code >= 500 or response.status_code == 429:
+                    breaker.record_failure(host)
+                    negative_cache.add(url, IMAGE_NEGATIVE_TTL_TRANSIENT)
+                    return None
+                if response.status_code != 200:
+                    # 404 and friends: the link is broken, the host is fine
+                    breaker.record_success(host)
+                    negative_cache.add(url, IMAGE_NEGATIVE_TTL)
+                    return None
+                breaker.record_success(host)
+
+                declared_length = response.headers.get("content-length", "")
+                if declared_length.isdigit() and int(declared_length) > IMAGE_MAX_BYTES:
+                    raise ImageTooLarge(declared_length)
+
+                size = 0
+                digest = hashlib.sha256()
+                content_type = None
+                f = await asyncio.to_thread(open, temp_path, "wb")
+                async for chunk in response.aiter_bytes(IMAGE_CHUNK_SIZE):
+                    if content_type is None:
+                        content_type = sniff_content_type(response.headers.get("content-type"), chunk)
+                        if content_type is None:
+                            print(f"⚠️ Upstream did not return an image: {url}")
+                            negative_cache.add(url, IMAGE_NEGATIVE_TTL)
+                            return None
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ImageTooLarge(size)
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+                await asyncio.to_thread(f.close)
+                f = None
+
+                if content_type is None:
+                    return None
+                handed_off = True
+                return Download(
+                    status=200,
+                    path=temp_path,
+                    size=size,
+                    digest=digest.hexdigest()[:32],
+                    content_type=content_type,
+                    etag=response.headers.get("etag"),
+                    last_modified=response.headers.get("last-modified"),
+                )
+    except ImageTooLarge as e:
+        print(f"⚠️ Image exceeds {IMAGE_MAX_BYTES} bytes ({e}): {url}")
+        negative_cache.add(url, IMAGE_NEGATIVE_TTL)
+    except (httpx.TimeoutException, httpx.TransportError) as e:
+        # Timeouts and connection errors count against the host
+        print(f"⚠️ Failed to fetch image from {url}: {e!r}")
+        breaker.record_failure(host)
+        negative_cache.add(url, IMAGE_NEGATIVE_TTL_TRANSIENT)
+    except Exception as e:
+        print(f"⚠️ Failed to fetch image from {url}: {e}")
+    finally:
+        if f is not None:
+            f.close()
+        if not handed_off:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    return None
+
+
+async def get_image(url: str) -> Optional[CachedImage]:
+    """Return a cache entry for `url`, fetching or revalidating as needed.
+
+    Callers arriving while a fetch for the same URL is in flight wait for
+    that fetch instead of starting their own. URLs that recently failed, or
+    whose host's breaker is open, return the stale entry (or None) at once.
+    """
+    proxy_stats["requests"] += 1
+    entry = image_cache.lookup(url)
+    if entry is not None and entry.is_fresh:
+        proxy_stats["cache_hits"] += 1
+        return entry
+
+    if url not in _inflight:
+        if url in negative_cache:
+            proxy_stats["negative_hits"] += 1
+            return entry
+        if not breaker.allow(host_of(url)):
+            proxy_stats["breaker_rejections"] += 1
+            return entry
+    return await _inflight.run(url, lambda: _refresh(url, entry))
+
+
+async def get_variant(url: str, width: Optional[int], fmt: Optional[str]) -> Optional[CachedImage]:
+    """Return a resized and/or re-encoded copy of the image at `url`.
+
+    Variants are cached under their own key. Without Pillow, or if the
+    original cannot be decoded, the original entry is returned instead.
+    """
+    width = image_variants.bucket_width(width)
+    if not image_variants.PILLOW_AVAILABLE or (not width and not fmt):
+        return await get_image(url)
+
+    variant_key = f"{url}#w={width or ''}&fmt={fmt or ''}"
+    entry = image_cache.lookup(variant_key)
+    if entry is not None and entry.is_fresh:
+        proxy_stats["cache_hits"] += 1
+        return entry
+
+    return await _inflight.run(variant_key, lambda: _make_variant(url, variant_key, width, fmt))
+
+
+async def _make_variant(
+    url: str, variant_key: str, width: Optional[int], fmt: Optional[str]
+) -> Optional[CachedImage]:
+    global _transcode_pool
+    original = await get_image(url)
+    if original is None:
+        return None
+
+    if _transcode_pool is None:
+        # Forking this process (MongoDB monitor and executor threads) could
+        # copy a held lock into the child; spawned workers start clean
+        _transcode_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_TRANSCODE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    loop = asyncio.get_running_loop()
+    try:
+        body, content_type = await loop.run_in_executor(
+            _transcode_pool,
+            image_variants.transcode,
+            image_cache.body_path(original.key),
+            width,
+            fmt,
+        )
+    except Exception as e:
+        print(f"⚠️ Could not build {width}px/{fmt} variant of {url}: {e}")
+        return original
+
+    proxy_stats["variants_generated"] += 1
+    return await image_cache.put(
+        variant_key,
+        body,
+        content_type=content_type,
+        last_modified=original.last_modified,
+    )
+
+
+async def _refresh(url: str, entry: Optional[CachedImage]) -> Optional[CachedImage]:
+    """Fetch (or revalidate) one URL upstream and store the result."""
+    if entry is not None:
+        result = await download(url, entry.etag, entry.last_modified)
+        if result is None:
+            # Upstream unavailable: a stale image beats no image
+            return entry
+        if result.status == 304:
+            return await image_cache.mark_revalidated(entry)
+    else:
+        result = await download(url)
+        if result is None:
+            return None
+
+    return await image_cache.put_file(
+        url,
+        result.path,
+        size=result.size,
+        digest=result.digest,
+        content_type=result.content_type,
+        etag=result.etag,
+        last_modified=result.last_modified,
+    )
@@ -0,0 +1,75 @@
+"""
+Resizing and transcoding of cached product images.
+
+`transcode` runs in a worker process (see image_proxy), so this module is
+kept free of app imports. Pillow is optional: without it the proxy serves
+original images and ignores variant parameters.
+"""
+import io
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    Image = None
+    PILLOW_AVAILABLE = False
+
+# Requested widths are rounded up to one of these so a handful of variants
+# per image serve every card size the app asks for
+VARIANT_WIDTHS = (100, 200, 300, 400, 600, 800)
+
+# fmt parameter -> (Pillow format, media type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+_MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif"}
+
+
+def bucket_width(width: Optional[int]) -> Optional[int]:
+    """Round a requested width up to the nearest supported variant width."""
+    if not width:
+        return None
+    for bucket in VARIANT_WIDTHS:
+        if width <= bucket:
+            return bucket
+    return VARIANT_WIDTHS[-1]
+
+
+def transcode(src_path: str, width: Optional[int], fmt: Optional[str]) -> Tuple[bytes, str]:
+    """Downscale an image file to `width` and/or re-encode it as `fmt`.
+
+    Returns (body, media type). Images narrower than `width` are not upscaled.
+    """
+    with Image.open(src_path) as img:
+        source_format = img.format or "JPEG"
+        if width and img.width > width:
+            # Let the JPEG decoder skip detail we are about to throw away
+            img.draft("RGB", (width, img.height * width // img.width))
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        else:
+            img.load()
+
+        out_format = VARIANT_FORMATS[fmt][0] if fmt else source_format
+        if out_format not in _MEDIA_TYPES:
+            out_format = "JPEG"
+
+        if out_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif out_format == "WEBP" and img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+
+        buffer = io.BytesIO()
+        if out_format == "WEBP":
+            options = {"quality": 80, "method": 4}
+        elif out_format == "JPEG":
+            options = {"quality": 80, "optimize": True}
+        else:
+            options = {"optimize": True}
+        img.save(buffer, format=out_format, **options)
+        return buffer.getvalue(), _MEDIA_TYPES[out_format]
@@ -0,0 +1,481 @@
+"""
+Bulk ingestion of cleaned scraper output into MongoDB.
+
+Each `scraper_*/cleaned/*.json` file is streamed (json_stream) into
+normalized product documents that are written as unordered bulk upserts. Every product gets a
+deterministic `_id` (see `product_key`), so an upsert is a point write on
+the primary key rather than a scan for a matching URL or name. Writes happen on a
+dedicated writer thread so parsing the next batch (or file) overlaps with
+MongoDB applying the previous one.
+
+Refreshes are incremental: a manifest (one document per cleaned file with
+its size, mtime, content hash and row count) records what has already been
+ingested, so only new or changed files are parsed again. A product can be
+listed by several files (e.g. per-category files of one retailer); it is
+tombstoned (removed from the live collection and recorded in the tombstone
+collection) once no file lists it any more. After a refresh
+that changed anything, cross-retailer match groups are recomputed
+(matching.py).
+"""
+import glob
+import hashlib
+import os
+import re
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+from barcodes import extract_gtin, extract_sku
+from json_stream import iter_json_records
+from matching import assign_match_groups
+from search_index import normalize
+
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "1000"))
+# Batches allowed to wait for the writer before parsing pauses
+SEED_MAX_PENDING_BATCHES = int(os.getenv("SEED_MAX_PENDING_BATCHES", "2"))
+
+BASE_PATH = os.path.dirname(__file__)
+# Look for files like: scraper_pnp/cleaned/picknpay_cleaned_data.json
+CLEANED_GLOB = os.path.join(BASE_PATH, "scraper_*", "cleaned", "*.json")
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """Cleans a price string (e.g., 'R 39.99') into a float (39.99)."""
+    if value is None:
+        return None
+    try:
+        # Remove any character that isn't a digit or a decimal point
+        cleaned = re.sub(r"[^0-9.]", "", str(value))
+        return float(cleaned) if cleaned else None
+    except Exception:
+        return None
+
+
+def cleaned_files() -> List[str]:
+    return sorted(glob.glob(CLEANED_GLOB))
+
+
+def source_name(filepath: str) -> str:
+    """Manifest key of a cleaned file (relative to Backend/)."""
+    return os.path.relpath(filepath, BASE_PATH).replace(os.sep, "/")
+
+
+def retailer_from_path(filepath: str) -> str:
+    """Infer retailer from filename or folder."""
+    lower_path = filepath.lower()
+    if "picknpay" in lower_path or "pnp" in lower_path: return "Pick n Pay"
+    elif "checkers" in lower_path: return "Checkers"
+    elif "woolworths" in lower_path: return "Woolworths"
+    elif "shoprite" in lower_path: return "Shoprite"
+    return "Unknown"
+
+
+def normalize_product(item: dict, retailer_name: str) -> Optional[dict]:
+    """Map one scraped item onto the stored product shape (None if unusable)."""
+    if not isinstance(item, dict):
+        return None
+    name = item.get("name") or item.get("productName") or item.get("title")
+    if not name:
+        return None
+
+    doc = {
+        "productName": name,
+        "price": parse_price(item.get("price") or item.get("price_str")),
+        "productImageURL": item.get("image") or item.get("productImageURL") or item.get("img"),
+        "productURL": item.get("buy_url") or item.get("url") or item.get("productURL"),
+        "category": item.get("category") or item.get("department") or "Uncategorized",
+        "retailer": item.get("retailer") or retailer_name,
+        "gtin": item.get("gtin") or item.get("barcode") or item.get("ean"),
+        "sku": item.get("sku"),
+        "updated_at": datetime.utcnow(),
+    }
+    doc.update(derived_fields(doc))
+    doc["_id"] = product_key(doc)
+    return doc
+
+
+def image_id(url: Optional[str]) -> Optional[str]:
+    """Short stable id of an image URL, served as /image/{id}."""
+    if not url:
+        return None
+    return hashlib.sha1(url.strip().encode("utf-8")).hexdigest()[:16]
+
+
+DERIVED_FIELDS = ("retailer_key", "category_key", "imageId", "gtin", "sku")
+
+
+def derived_fields(doc: dict) -> dict:
+    """Fields computed from a product at ingest time.
+
+    retailer_key / category_key are case/accent-folded copies of the
+    filterable fields: /products filters match them exactly, so "checkers"
+    and "Checkers" are the same index lookup instead of a case-insensitive
+    regex. imageId names the product image for the /image/{id} proxy route.
+    gtin / sku are the barcode and retailer product code (see barcodes.py).
+    """
+    return {
+        "retailer_key": normalize(doc.get("retailer")),
+        "category_key": normalize(doc.get("category")),
+        "imageId": image_id(doc.get("productImageURL")),
+        "gtin": extract_gtin(doc),
+        "sku": extract_sku(doc),
+    }
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a product URL: no query/fragment, lowercase host."""
+    url = url.strip().split("#", 1)[0].split("?", 1)[0].rstrip("/")
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return url.lower()
+    host, slash, path = rest.partition("/")
+    return f"{scheme.lower()}://{host.lower()}{slash}{path}"
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", str(text).lower()).strip("-") or "unknown"
+
+
+def product_key(doc: dict) -> str:
+    """Deterministic product id: retailer slug + hash of its URL (or name).
+
+    The same retailer product always maps to the same key, whichever file or
+    scrape it arrives from, e.g. "pick-n-pay:9c1d0e7f6a4b3c2d1e0f".
+    """
+    if doc.get("productURL"):
+        identity = "url:" + normalize_url(doc["productURL"])
+    else:
+        identity = "name:" + " ".join(str(doc.get("productName", "")).lower().split())
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:20]
+    return f"{_slug(doc.get('retailer') or 'unknown')}:{digest}"
+
+
+class BulkWriter:
+    """Applies upsert batches on one background thread, in submission order.
+
+    `submit` blocks once SEED_MAX_PENDING_BATCHES are queued, which bounds
+    memory while still letting the caller parse ahead of the database.
+    """
+
+    def __init__(self, collection, index=None, max_pending: int = SEED_MAX_PENDING_BATCHES):
+        self.collection = collection
+        self.index = index
+        self.max_pending = max(1, max_pending)
+        self.inserted = 0
+        self.updated = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seed-writer")
+        self._pending: List[Future] = []
+
+    def submit(self, docs: List[dict]) -> Future:
+        while len(self._pending) >= self.max_pending:
+            self._pending.pop(0).result()
+        future = self._executor.submit(self._write, docs)
+        self._pending.append(future)
+        return future
+
+    def _write(self, docs: List[dict]):
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {k: v for k, v in doc.items() if k != "_id"}}, upsert=True)
+            for doc in docs
+        ]
+        result = self.collection.bulk_write(ops, ordered=False)
+        self.inserted += result.upserted_count
+        self.updated += len(docs) - result.upserted_count
+
+        if self.index is not None:
+            for doc in docs:
+                self.index.add(doc)
+
+    def flush(self):
+        while self._pending:
+            self._pending.pop(0).result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def _batched_unique(docs: Iterable[dict], batch_size: int) -> Iterable[List[dict]]:
+    """Group docs into batches with no repeated upsert key inside a batch.
+
+    Unordered bulk upserts of the same key in one batch could insert twice.
+    """
+    batch: Dict[str, dict] = {}
+    for doc in docs:
+        key = doc["_id"]
+        if key in batch:
+            yield list(batch.values())
+            batch = {}
+        batch[key] = doc
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def new_run_id() -> str:
+    """Ingest run id; ids of later runs sort after earlier ones."""
+    return f"{datetime.utcnow():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+
+
+def source_stamp_field(source: str) -> str:
+    """Field holding the run that last wrote a product from `source`.
+
+    Products keep one stamp per file that lists them, under
+    `file_runs.<hash of the source name>` (source names contain dots, which
+    cannot appear in a field path).
+    """
+    return "file_runs." + hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+def _stamped(docs: Iterable[Optional[dict]], source: str, run_id: str) -> Iterable[dict]:
+    field = source_stamp_field(source)
+    for doc in docs:
+        if doc:
+            # Written with $set, so other files' stamps are left alone
+            doc[field] = run_id
+            yield doc
+
+
+def ingest_files(
+    collection,
+    files: Optional[List[str]] = None,
+    index=None,
+    batch_size: int = SEED_BATCH_SIZE,
+    run_id: Optional[str] = None,
+) -> dict:
+    """Upsert the products of every cleaned file into `collection`.
+
+    Every written product is stamped with the run id for its file (see
+    `source_stamp_field`), which is what tombstoning compares against. Returns
+    totals plus per-file row counts and throughput; files that could not be
+    read completely are listed under "errors".
+    """
+    files = cleaned_files() if files is None else files
+    run_id = run_id or new_run_id()
+    writer = BulkWriter(collection, index=index)
+    report = {"inserted": 0, "updated": 0, "files": [], "errors": {}}
+    try:
+        for filepath in files:
+            source = source_name(filepath)
+            retailer_name = retailer_from_path(filepath)
+            started = time.perf_counter()
+
+            # Records are parsed, normalized and batched lazily, so only the
+            # batches in flight are held in memory
+            docs = (normalize_product(item, retailer_name) for item in iter_json_records(filepath))
+            rows = 0
+            last_batch = None
+            try:
+                for batch in _batched_unique(_stamped(docs, source, run_id), batch_size):
+                    last_batch = writer.submit(batch)
+                    rows += len(batch)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Error reading {filepath} after {rows} rows: {e}")
+                report["errors"][source] = str(e)
+                if not rows:
+                    continue
+
+            # Timed until this file's last batch is written (the next file is
+            # already being parsed meanwhile)
+            stats = {"file": source, "rows": rows,
+                     "_started": started, "_finished": time.perf_counter()}
+            if last_batch is not None:
+                last_batch.add_done_callback(lambda _, s=stats: s.update(_finished=time.perf_counter()))
+            report["files"].append(stats)
+    finally:
+        writer.close()
+
+    for stats in report["files"]:
+        elapsed = stats.pop("_finished") - stats.pop("_started")
+        stats["seconds"] = round(elapsed, 3)
+        stats["rows_per_sec"] = round(stats["rows"] / elapsed) if elapsed > 0 else stats["rows"]
+        print(f"📄 {stats['file']}: {stats['rows']} rows in {elapsed:.2f}s ({stats['rows_per_sec']} rows/s)")
+
+    report["inserted"] = writer.inserted
+    report["updated"] = writer.updated
+    return report
+
+
+def file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan_refresh(manifest, files: List[str]) -> Tuple[List[str], Dict[str, dict]]:
+    """Split `files` into those needing ingestion and fingerprints to record.
+
+    A file whose size and mtime match its manifest entry is skipped without
+    being read; otherwise its content hash decides (a touched but identical
+    file only has its manifest entry refreshed). Returns (changed files,
+    {source: fingerprint} for every file examined).
+    """
+    known = {entry["_id"]: entry for entry in manifest.find({})}
+    changed, fingerprints = [], {}
+    for filepath in files:
+        source = source_name(filepath)
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            continue
+        fingerprint = {"size": st.st_size, "mtime": st.st_mtime}
+        entry = known.get(source)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime:
+            continue
+        try:
+            fingerprint["sha256"] = file_sha256(filepath)
+        except OSError:
+            continue
+        fingerprints[source] = fingerprint
+        if entry and entry.get("sha256") == fingerprint["sha256"]:
+            fingerprint["rows"] = entry.get("rows", 0)
+            continue
+        changed.append(filepath)
+    return changed, fingerprints
+
+
+def tombstone_stale(collection, tombstones, source: str, keep_run: Optional[str], index=None) -> int:
+    """Drop `source` from products it no longer lists (stamped before `keep_run`).
+
+    Only stamps older than `keep_run` count as stale, so a newer run's
+    writes are never undone by an older one. Pass keep_run=None to drop
+    everything the file contributed (the file itself is gone). Products
+    that no other file lists any more are tombstoned; returns how many.
+    """
+    field = source_stamp_field(source)
+    query = {field: {"$exists": True}}
+    if keep_run is not None:
+        query[field]["$lt"] = keep_run
+    stale_ids = [doc["_id"] for doc in collection.find(query, {"_id": 1})]
+    if not stale_ids:
+        return 0
+    collection.update_many({"_id": {"$in": stale_ids}, **query}, {"$unset": {field: ""}})
+
+    # Still listed by another file: keep it live
+    orphaned = {"_id": {"$in": stale_ids}, "file_runs": {}}
+    stale = list(collection.find(orphaned, {"productName": 1, "retailer": 1}))
+    if not stale:
+        return 0
+
+    removed_at = datetime.utcnow()
+    tombstones.bulk_write(
+        [
+            ReplaceOne(
+                {"_id": doc["_id"]},
+                {**doc, "source_file": source, "removed_at": removed_at},
+                upsert=True,
+            )
+            for doc in stale
+        ],
+        ordered=False,
+    )
+    ids = [doc["_id"] for doc in stale]
+    # Guard on the stamps again: a product re-written meanwhile stays live
+    collection.delete_many({"_id": {"$in": ids}, "file_runs": {}})
+    if index is not None:
+        for doc_id in ids:
+            index.remove(doc_id)
+    return len(ids)
+
+
+def refresh_files(
+    collection,
+    manifest,
+    tombstones,
+    index=None,
+    batch_size: int = SEED_BATCH_SIZE,
+) -> dict:
+    """Ingest only the cleaned files that are new or changed since last time.
+
+    Rows that vanished from a re-ingested file, and every row of a file that
+    no longer exists, are tombstoned. Files that fail to parse keep their old
+    manifest entry (and rows) so the next refresh retries them.
+    """
+    files = cleaned_files()
+    changed, fingerprints = plan_refresh(manifest, files)
+    run_id = new_run_id()
+    report = ingest_files(collection, changed, index=index, batch_size=batch_size, run_id=run_id)
+    rows_by_source = {stats["file"]: stats["rows"] for stats in report["files"]}
+
+    tombstoned = 0
+    ingested_at = datetime.utcnow()
+    for filepath in changed:
+        source = source_name(filepath)
+        if source in report["errors"]:
+            continue
+        tombstoned += tombstone_stale(collection, tombstones, source, run_id, index=index)
+        fingerprints[source]["rows"] = rows_by_source.get(source, 0)
+    for source, fingerprint in fingerprints.items():
+        if source in report["errors"]:
+            continue
+        manifest.replace_one(
+            {"_id": source}, {**fingerprint, "ingested_at": ingested_at}, upsert=True
+        )
+
+    present = {source_name(filepath) for filepath in files}
+    removed = [entry["_id"] for entry in manifest.find({"_id": {"$nin": list(present)}}, {"_id": 1})]
+    for source in removed:
+        tombstoned += tombstone_stale(collection, tombstones, source, None, index=index)
+        manifest.delete_one({"_id": source})
+
+    report["skipped"] = len(files) - len(changed)
+    report["tombstoned"] = tombstoned
+    report["removed_files"] = removed
+    # Matching compares products across retailers, so it runs over the
+    # whole catalog once the files are in
+    report["matched"] = assign_match_groups(collection) if changed or removed else 0
+    print(
+        f"🗂️ Refresh: {len(changed)} changed, {report['skipped']} unchanged, "
+        f"{len(removed)} removed files; {tombstoned} products tombstoned."
+    )
+    return report
+
+
+def migrate_legacy_ids(collection, batch_size: int = SEED_BATCH_SIZE) -> int:
+    """Re-key documents written before product keys existed (ObjectId `_id`).
+
+    Each legacy document is copied under its product key and the original
+    removed, folding duplicates of the same product together.
+    """
+    migrated = 0
+    ops = []
+    for doc in collection.find({"_id": {"$type": "objectId"}}):
+        legacy_id = doc.pop("_id")
+        ops.append(ReplaceOne({"_id": product_key(doc)}, doc, upsert=True))
+        ops.append(DeleteOne({"_id": legacy_id}))
+        if len(ops) >= 2 * batch_size:
+            collection.bulk_write(ops, ordered=True)
+            migrated += len(ops) // 2
+            ops = []
+    if ops:
+        collection.bulk_write(ops, ordered=True)
+        migrated += len(ops) // 2
+    return migrated
+
+
+def backfill_derived_fields(collection, batch_size: int = SEED_BATCH_SIZE) -> int:
+    """Add derived fields (see `derived_fields`) to documents ingested before they existed."""
+    updated = 0
+    ops = []
+    missing = {"$or": [{field: {"$exists": False}} for field in DERIVED_FIELDS]}
+    projection = {"retailer": 1, "category": 1, "productImageURL": 1, "productURL": 1, "gtin": 1, "sku": 1}
+    for doc in collection.find(missing, projection):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": derived_fields(doc)}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
@@ -0,0 +1,183 @@
+"""
+Streaming reader for cleaned scraper output.
+
+Yields the product records of a JSON file one at a time without loading the
+whole document, so multi-hundred-MB crawls can be ingested with bounded
+memory. Supported layouts:
+
+- a top-level array:               [ {...}, {...} ]
+- an object wrapping arrays:        {"picknpay": [ {...}, ... ]}
+- JSON Lines, one record per line: {...}\n{...}\n
+
+Array elements are decoded with the C-accelerated stdlib scanner; JSON
+Lines use orjson when it is installed.
+"""
+import json
+from typing import Any, Iterator
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+CHUNK_SIZE = 64 * 1024
+# A first line longer than this is not treated as a JSON Lines record
+_MAX_PROBE_CHARS = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class _Scanner:
+    """Pull-based tokenizer over a text file, holding about one value in memory."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r}, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A bare number/literal ending exactly at the buffer edge may be cut short
+            if end == len(self.buf) and not isinstance(obj, (dict, list, str)) and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def _iter_array(scanner: _Scanner) -> Iterator[Any]:
+    scanner.expect("[")
+    if scanner.peek() == "]":
+        scanner.pos += 1
+        return
+    while True:
+        yield scanner.value()
+        separator = scanner.peek()
+        scanner.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"expected ',' or ']' in array, found {separator or 'end of file'!r}")
+
+
+def _iter_wrapped(scanner: _Scanner) -> Iterator[Any]:
+    """Elements of every array-valued key of a top-level object."""
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return
+    while True:
+        scanner.value()  # key
+        scanner.expect(":")
+        if scanner.peek() == "[":
+            yield from _iter_array(scanner)
+        else:
+            scanner.value()
+        separator = scanner.peek()
+        scanner.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"expected ',' or '}}' in object, found {separator or 'end of file'!r}")
+
+
+# Keys that make an object a product record rather than a wrapper
+_RECORD_KEYS = ("name", "productName", "title")
+
+
+def _unwrap(obj: Any) -> Iterator[Any]:
+    """A JSON Lines record, or the records inside a wrapper line.
+
+    Wrappers are arrays, or objects that are not themselves a record and
+    hold arrays of objects ({"picknpay": [{...}, ...]}). Any other line,
+    including a record with list-valued fields, is yielded as it is.
+    """
+    if isinstance(obj, list):
+        yield from obj
+    elif (
+        isinstance(obj, dict)
+        and not any(key in obj for key in _RECORD_KEYS)
+        and any(_is_record_list(v) for v in obj.values())
+    ):
+        for v in obj.values():
+            if _is_record_list(v):
+                yield from v
+    else:
+        yield obj
+
+
+def _is_record_list(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _is_json_lines(scanner: _Scanner) -> bool:
+    """True when the first line of the file is a complete JSON value."""
+    while "\n" not in scanner.buf[scanner.pos:] and len(scanner.buf) - scanner.pos < _MAX_PROBE_CHARS:
+        if not scanner.fill():
+            break
+    first_line = scanner.buf[scanner.pos:].split("\n", 1)[0].strip()
+    if not first_line or len(first_line) >= _MAX_PROBE_CHARS:
+        return False
+    try:
+        _loads(first_line)
+    except ValueError:
+        return False
+    # A one-line document with nothing after it is handled the same either way
+    return True
+
+
+def iter_json_records(filepath: str) -> Iterator[Any]:
+    """Yield the records of a cleaned JSON / JSON Lines file one by one."""
+    # utf-8-sig tolerates files saved with a byte-order mark
+    with open(filepath, "r", encoding="utf-8-sig") as f:
+        scanner = _Scanner(f)
+        first = scanner.peek()
+        if first == "":
+            return
+        if first == "[" and not _is_json_lines(scanner):
+            yield from _iter_array(scanner)
+        elif first == "{" and not _is_json_lines(scanner):
+            yield from _iter_wrapped(scanner)
+        else:
+            f.seek(0)
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield from _unwrap(_loads(line))
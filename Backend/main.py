@@ -1,23 +1,40 @@
 import os
-import json
-import glob
-import re
 import asyncio
 import subprocess
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from typing import List, Optional, Any
 from urllib.parse import quote, unquote
 import base64
-import httpx
+import hashlib
+import json
 
 import pytz
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, Field, BeforeValidator, AnyUrl
 from typing_extensions import Annotated
-from pymongo import MongoClient, ASCENDING
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ExecutionTimeout
+
+import image_proxy
+import barcodes
+import ingest
+import matching
+import mongo
+from compression import CompressionMiddleware, encode_cached, encoded_etag
+from response_cache import CachedResponse, ResponseCache
+from image_cache import IMAGE_MEMORY_ITEM_MAX_BYTES
+from image_variants import VARIANT_FORMATS
+from mongo import DB_NAME, MONGO_MAX_TIME_MS, store, tombstones_collection, run_db
+from search_index import SearchIndex, INDEXED_FIELDS, normalize, tokenize
 
 # ---------------------------------------------------------------------------
 # 1. CONFIGURATION & DATABASE SETUP
@@ -26,22 +43,93 @@ from pymongo import MongoClient, ASCENDING
 # Load environment variables
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("MONGO_DB")
-COLLECTION_NAME = os.getenv("MONGO_COLLECTION")
+# The pooled client and the thread pool that runs its blocking calls live
+# in mongo.py; handlers must go through `run_db` rather than calling
+# pymongo on the event loop.
 
-# Connect to MongoDB
-try:
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    products_collection = db[COLLECTION_NAME]
-    # Create indexes for faster searching
-    products_collection.create_index([("name", ASCENDING)])
-    products_collection.create_index([("retailer", ASCENDING)])
-    products_collection.create_index([("category", ASCENDING)])
-    print(f"✅ Connected to MongoDB: {DB_NAME} / {COLLECTION_NAME}")
-except Exception as e:
-    print(f"❌ Could not connect to MongoDB: {e}")
+# Full reseeds refuse to go live if the new generation has fewer products
+# than this fraction of the live one (override with force=true)
+RESEED_MIN_RATIO = float(os.getenv("RESEED_MIN_RATIO", "0.5"))
+# Base URL the app reaches this API on; image links in product payloads
+# point here (set it to your laptop's address when testing on an emulator)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://192.168.0.140:8000").rstrip("/")
+# Catalog responses may be stored but must be revalidated (cheap with ETags)
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "no-cache")
+# Lower edges of the /facets price bands (the last band is open-ended)
+FACET_PRICE_BOUNDARIES = tuple(
+    float(edge) for edge in os.getenv("FACET_PRICE_BOUNDARIES", "0,20,50,100,200,500").split(",")
+)
+# /home bundle: quick-search chips (same terms as the app's home page) and
+# how many products come with each chip / the recommended row
+HOME_QUICK_SEARCHES = tuple(
+    term.strip() for term in os.getenv(
+        "HOME_QUICK_SEARCHES", "Milk,Rice,Bread,Eggs,Chicken,Oil,Tomato,Sugar"
+    ).split(",") if term.strip()
+)
+HOME_QUICK_SEARCH_LIMIT = int(os.getenv("HOME_QUICK_SEARCH_LIMIT", "10"))
+HOME_RECOMMENDED_LIMIT = int(os.getenv("HOME_RECOMMENDED_LIMIT", "6"))
+# Resolved /image/{id} lookups kept in memory
+IMAGE_ID_CACHE_SIZE = int(os.getenv("IMAGE_ID_CACHE_SIZE", "20000"))
+# How often a worker checks whether another process swapped generations
+STORE_SYNC_SECONDS = int(os.getenv("STORE_SYNC_SECONDS", "10"))
+
+# Single-field indexes the original deployment created; no query uses them now
+LEGACY_INDEXES = ("name_1", "retailer_1", "category_1")
+
+def ensure_product_indexes(collection) -> List[str]:
+    """Create the product indexes on `collection` (a live or shadow generation).
+
+    Products are keyed by their deterministic product key (_id), so upserts
+    and lookups use the primary index. The price-ordered compound indexes
+    match the filter shapes of /products (none, retailer, category, both;
+    equality on the normalized *_key fields, then price and _id order), so
+    every listing is an index scan without an in-memory sort. Unpriced rows
+    (price null, ordered by _id) use the same indexes.
+    """
+    existing = collection.index_information()
+    for name in LEGACY_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
+    return [
+        collection.create_index([("price", ASCENDING), ("_id", ASCENDING)]),
+        collection.create_index([("retailer_key", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]),
+        collection.create_index([("category_key", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]),
+        collection.create_index(
+            [("retailer_key", ASCENDING), ("category_key", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]
+        ),
+        # /compare/{group} lists a match group
+        collection.create_index([("matchGroup", ASCENDING), ("price", ASCENDING)]),
+        # /products/by-barcode/{gtin}; SKUs are per retailer
+        collection.create_index([("gtin", ASCENDING), ("price", ASCENDING)]),
+        collection.create_index([("retailer_key", ASCENDING), ("sku", ASCENDING)]),
+        # /image/{id} resolves the upstream URL by image id
+        collection.create_index([("imageId", ASCENDING)]),
+        # Incremental refreshes find a file's products by its run stamp
+        collection.create_index([("file_runs.$**", ASCENDING)]),
+    ]
+
+# In-memory search index (built on startup, updated by seeding, replaced
+# wholesale when a reseed or rollback swaps the live generation)
+search_index = SearchIndex()
+# Serializes seeding so a post-scrape refresh never races a reseed
+ingest_lock = asyncio.Lock()
+# The event loop only keeps a weak reference to tasks
+generation_follower: Optional[asyncio.Task] = None
+# image id -> upstream URL, oldest first (bounded by IMAGE_ID_CACHE_SIZE)
+image_urls: dict = {}
+# Serialized /products pages, invalidated by catalog version bumps
+products_cache = ResponseCache()
+# The /home bundle: one entry, replaced only when the catalog version
+# changes (no TTL, and /products traffic cannot evict it)
+home_cache = ResponseCache(max_entries=1, ttl=float("inf"))
+SEARCH_PROJECTION = {field: 1 for field in INDEXED_FIELDS}
+# Listing reads fetch only what ProductOut returns (price and _id also drive the cursor)
+PRODUCT_PROJECTION = {
+    field: 1 for field in (
+        "productName", "price", "productImageURL", "imageId", "productURL", "category", "retailer", "matchGroup",
+        "gtin", "sku",
+    )
+}
 
 # ---------------------------------------------------------------------------
 # 2. PYDANTIC SCHEMAS (DATA MODELS)
@@ -52,7 +140,7 @@ PyObjectId = Annotated[str, BeforeValidator(str)]
 
 class ProductBase(BaseModel):
     productName: str
-    price: Optional[str] = None
+    price: Optional[float] = None
     productImageURL: Optional[str] = None
     productURL: Optional[str] = None
     category: Optional[str] = "Uncategorized"
@@ -60,6 +148,11 @@ class ProductBase(BaseModel):
 
 class ProductOut(ProductBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    # Same product at other retailers: /compare/{matchGroup}
+    matchGroup: Optional[str] = None
+    # Barcode (EAN-13) and the retailer's own product code, when known
+    gtin: Optional[str] = None
+    sku: Optional[str] = None
 
     class Config:
         populate_by_name = True
@@ -94,36 +187,295 @@ except ImportError:
     def within_crawl_window():
         return True, "Window check unavailable (Dev Mode)"
 
-def parse_price(value: Any) -> Optional[float]:
-    """Cleans a price string (e.g., 'R 39.99') into a float (39.99)."""
-    if value is None:
-        return None
+def encode_cursor(product: dict, descending: bool) -> str:
+    """Build an opaque page token from the last (price, _id) of a page."""
+    payload = json_util.dumps({"p": product.get("price"), "i": product["_id"], "d": int(descending)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str, descending: bool) -> tuple:
+    """Reverse of encode_cursor; raises ValueError for foreign or stale tokens."""
     try:
-        # Remove any character that isn't a digit or a decimal point
-        cleaned = re.sub(r"[^0-9.]", "", str(value))
-        return float(cleaned) if cleaned else None
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        after = (payload["p"], payload["i"])
+        token_descending = bool(payload["d"])
     except Exception:
+        raise ValueError("malformed cursor")
+    if token_descending != descending:
+        raise ValueError("cursor was issued for a different sort order")
+    # The values go straight into the query: anything else (e.g. an
+    # {"$ne": ...} document) would act as an operator
+    price, product_id = after
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))):
+        raise ValueError("malformed cursor")
+    if not isinstance(product_id, (str, ObjectId)):
+        raise ValueError("malformed cursor")
+    return after
+
+def find_price_sorted(
+    query: dict,
+    descending: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[tuple] = None,
+) -> List[dict]:
+    """Fetch one page of products ordered by price, missing prices last.
+
+    Priced and unpriced products are read as two index-backed ranges so the
+    database does the ordering for every page, not just the first one.
+    When `after` (the (price, _id) of the previous page's last product) is
+    given, the page starts right after it and `skip` is ignored, so deep
+    pages cost the same as the first.
+    """
+    direction = DESCENDING if descending else ASCENDING
+    products = []
+
+    # One generation for the whole page, even if a reseed swaps mid-request
+    collection = store.products
+    if after is not None:
+        skip = 0
+    after_price, after_id = after if after is not None else (None, None)
+
+    # Priced range (skipped entirely once a cursor has reached unpriced rows)
+    if after is None or after_price is not None:
+        priced_query = {**query, "price": {"$gte": 0}}
+        if after is not None:
+            beyond = "$lt" if descending else "$gt"
+            priced_query = {"$and": [priced_query, {"$or": [
+                {"price": {beyond: after_price}},
+                {"price": after_price, "_id": {beyond: after_id}},
+            ]}]}
+        products = list(
+            collection.find(priced_query, PRODUCT_PROJECTION)
+            .sort([("price", direction), ("_id", direction)])
+            .skip(skip)
+            .limit(limit)
+            .max_time_ms(MONGO_MAX_TIME_MS)
+        )
+        if limit and len(products) >= limit:
+            return products
+
+    # Page runs past the priced products: continue with the unpriced ones
+    unpriced_query = {**query, "price": None}
+    unpriced_skip = 0
+    if after is not None and after_price is None:
+        # $and keeps any _id filter from the query (search matches)
+        unpriced_query = {"$and": [unpriced_query, {"_id": {"$gt": after_id}}]}
+    elif skip:
+        if products:
+            priced_total = skip + len(products)
+        else:
+            priced_total = collection.count_documents(priced_query, maxTimeMS=MONGO_MAX_TIME_MS)
+        unpriced_skip = max(0, skip - priced_total)
+
+    unpriced = (
+        collection.find(unpriced_query, PRODUCT_PROJECTION)
+        .sort("_id", ASCENDING)
+        .skip(unpriced_skip)
+        .limit(limit - len(products) if limit else 0)
+        .max_time_ms(MONGO_MAX_TIME_MS)
+    )
+    products.extend(unpriced)
+    return products
+
+def search_terms_of(search: Optional[str]) -> Optional[str]:
+    """Normalized search terms; None without a search, "" for one with no
+    searchable tokens (e.g. only punctuation), which matches nothing."""
+    if not search:
         return None
+    return " ".join(tokenize(search))
 
-async def fetch_image_from_url(url: str) -> Optional[bytes]:
-    """Fetch image bytes from external URL using httpx."""
-    if not url:
+def product_filter(search_terms: Optional[str], retailer_key: str, category_key: str) -> Optional[dict]:
+    """MongoDB filter for a normalized search/retailer/category selection.
+
+    None when the search matches nothing, so callers can skip the query.
+    """
+    query = {}
+
+    # Search terms are resolved against the in-memory index (product name,
+    # category and retailer tokens), so MongoDB only sees an _id lookup
+    if search_terms is not None:
+        if not search_terms:
+            return None
+        matched_ids = search_index.search(search_terms)
+        if not matched_ids:
+            return None
+        query["_id"] = {"$in": list(matched_ids)}
+
+    # Filter by Retailer / Category: exact match on the normalized copies
+    # stored at ingest, which is an index lookup (case-insensitive)
+    if retailer_key:
+        query["retailer_key"] = retailer_key
+
+    if category_key:
+        query["category_key"] = category_key
+    return query
+
+def facet_counts(query: dict) -> dict:
+    """Category, retailer and price-band counts for `query` in one aggregation."""
+    price_bands = {"$bucket": {
+        "groupBy": "$price",
+        "boundaries": list(FACET_PRICE_BOUNDARIES),
+        # Prices above the last boundary
+        "default": FACET_PRICE_BOUNDARIES[-1],
+        "output": {"count": {"$sum": 1}},
+    }}
+    pipeline = [
+        {"$match": query},
+        {"$facet": {
+            "categories": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+            "retailers": [{"$group": {"_id": "$retailer", "count": {"$sum": 1}}}],
+            "prices": [{"$match": {"price": {"$gte": FACET_PRICE_BOUNDARIES[0]}}}, price_bands],
+            "unpriced": [{"$match": {"price": None}}, {"$count": "count"}],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    result = next(store.products.aggregate(pipeline, maxTimeMS=MONGO_MAX_TIME_MS), {})
+
+    def named(groups):
+        return sorted(
+            ({"name": g["_id"], "count": g["count"]} for g in groups if g["_id"]),
+            key=lambda item: item["name"],
+        )
+
+    band_counts = {band["_id"]: band["count"] for band in result.get("prices", [])}
+    bounds = list(FACET_PRICE_BOUNDARIES) + [None]
+    return {
+        "total": (result.get("total") or [{"count": 0}])[0]["count"],
+        "categories": named(result.get("categories", [])),
+        "retailers": named(result.get("retailers", [])),
+        "prices": [
+            {"min": low, "max": high, "count": band_counts.get(low, 0)}
+            for low, high in zip(bounds, bounds[1:])
+        ],
+        "unpriced": (result.get("unpriced") or [{"count": 0}])[0]["count"],
+    }
+
+def build_home_bundle() -> dict:
+    """Everything the app's home screen shows, for the live catalog.
+
+    Recommended products are the cheapest product of each of the largest
+    categories, so the row spans several aisles.
+    """
+    facets = facet_counts({})
+    quick_searches = []
+    for term in HOME_QUICK_SEARCHES:
+        query = product_filter(search_terms_of(term), "", "")
+        products = find_price_sorted(query, limit=HOME_QUICK_SEARCH_LIMIT) if query is not None else []
+        quick_searches.append({"term": term, "products": [shape_product(p) for p in products]})
+
+    recommended = []
+    for group in sorted(facets["categories"], key=lambda g: -g["count"]):
+        if len(recommended) >= HOME_RECOMMENDED_LIMIT:
+            break
+        cheapest = find_price_sorted({"category_key": normalize(group["name"])}, limit=1)
+        recommended.extend(shape_product(p) for p in cheapest if p.get("price") is not None)
+
+    return {
+        "catalog_version": store.version,
+        "categories": facets["categories"],
+        "retailers": facets["retailers"],
+        "quick_searches": quick_searches,
+        "recommended": recommended,
+    }
+
+def is_not_modified(request_headers, etag: str, last_modified: Optional[str] = None) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against a response's validators."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match wins over If-Modified-Since; weak comparison is fine for GET
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def catalog_version() -> tuple:
+    """Version tag of catalog responses (cache entries and ETags).
+
+    A generation swap or sync publishes store.version before the new search
+    index is in place; tagging with the version the index was built for as
+    well keeps pages computed in that window from being served afterwards.
+    """
+    return (store.version, search_index.catalog_version)
+
+def catalog_etag(version: Any, *parts: Any) -> str:
+    """Strong ETag for a catalog response: live generation + catalog version + query."""
+    raw = "|".join(str(part) for part in (store.active, version, *parts))
+    return f'"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]}"'
+
+def catalog_not_modified(request: Optional[Request], etag: str) -> Optional[str]:
+    """The ETag (in any of its encodings) the client already holds, if current."""
+    if request is None:
         return None
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, follow_redirects=True)
-            if response.status_code == 200:
-                return response.content
-    except Exception as e:
-        print(f"⚠️ Failed to fetch image from {url}: {e}")
+    for encoding in (None, "gzip", "br"):
+        tag = encoded_etag(etag, encoding)
+        if is_not_modified(request.headers, tag):
+            return tag
     return None
 
-def add_image_proxy_url(product: dict, base_url: str = "http://192.168.0.140:8000") -> dict: #add your laptop url here or else backend wont work due to some andrior emulator stuff 
-    """Replace productImageURL with proxy URL if image exists."""
+def catalog_response(request: Optional[Request], etag: str, page: Optional[CachedResponse]) -> Response:
+    """200 with the cached body (pre-compressed when the client accepts it).
+
+    Pass page=None for a 304 carrying `etag` (see catalog_not_modified).
+    """
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if page is None:
+        return Response(status_code=304, headers=headers)
+    accept_encoding = request.headers.get("accept-encoding") if request is not None else None
+    body, encoding = encode_cached(page.body, page.encoded, accept_encoding)
+    headers["ETag"] = encoded_etag(etag, encoding)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers={**page.headers, **headers})
+
+def image_proxy_url(product: dict) -> Optional[str]:
+    """Public URL of a product's image through this API's /image proxy."""
+    if product.get("imageId"):
+        return f"{PUBLIC_BASE_URL}/image/{product['imageId']}"
     if product.get("productImageURL"):
-        encoded_url = quote(product["productImageURL"], safe="")
-        product["productImageURL"] = f"{base_url}/image?url={encoded_url}"
-    return product
+        # Not yet given an imageId (backfilled at startup)
+        return f"{PUBLIC_BASE_URL}/image?url={quote(product['productImageURL'], safe='')}"
+    return None
+
+def json_dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _optional_str(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+def shape_product(doc: dict) -> dict:
+    """A stored product as the ProductOut JSON object, without model validation.
+
+    Mirrors ProductOut field for field (order, defaults, `_id` as a string)
+    so listings can skip building pydantic models per row.
+    """
+    price = doc.get("price")
+    if price is not None:
+        price = float(price) if isinstance(price, (int, float)) else ingest.parse_price(price)
+    return {
+        "productName": str(doc.get("productName") or ""),
+        "price": price,
+        "productImageURL": image_proxy_url(doc),
+        "productURL": _optional_str(doc.get("productURL")),
+        "category": _optional_str(doc.get("category", "Uncategorized")),
+        "retailer": _optional_str(doc.get("retailer", "Unknown")),
+        "_id": str(doc["_id"]) if doc.get("_id") is not None else None,
+        "matchGroup": _optional_str(doc.get("matchGroup")),
+        "gtin": _optional_str(doc.get("gtin")),
+        "sku": _optional_str(doc.get("sku")),
+    }
+
+def serialize_products(products: List[dict]) -> bytes:
+    """JSON body for a product list, shaped exactly like response_model=List[ProductOut]."""
+    return json_dumps([shape_product(product) for product in products])
 
 # ---------------------------------------------------------------------------
 # 4. FASTAPI APP INIT
@@ -139,90 +491,191 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Compresses JSON bodies not already encoded (catalog responses arrive pre-compressed)
+app.add_middleware(CompressionMiddleware)
+
+@app.exception_handler(ExecutionTimeout)
+async def query_timeout_handler(request, exc):
+    """A query hit MONGO_MAX_TIME_MS: fail fast instead of holding the worker."""
+    return JSONResponse(status_code=503, content={"detail": "Database query timed out"})
 
 # ---------------------------------------------------------------------------
 # 5. DATABASE SEEDING LOGIC
 # ---------------------------------------------------------------------------
 
-def seed_database_from_json():
-    """Reads cleaned JSON files from scraper folders and inserts into MongoDB."""
-    base_path = os.path.dirname(__file__)
-    # Look for files like: scraper_pnp/cleaned/picknpay_cleaned_data.json
-    pattern = os.path.join(base_path, "scraper_*", "cleaned", "*.json")
-    files = glob.glob(pattern)
+def seed_database_from_json(full: bool = False) -> dict:
+    """Reads cleaned JSON files from scraper folders and upserts them into MongoDB.
 
-    seeded_count = 0
-    
-    for filepath in files:
-        # Infer retailer from filename or folder
-        retailer_name = "Unknown"
-        lower_path = filepath.lower()
-        if "picknpay" in lower_path or "pnp" in lower_path: retailer_name = "Pick n Pay"
-        elif "checkers" in lower_path: retailer_name = "Checkers"
-        elif "woolworths" in lower_path: retailer_name = "Woolworths"
-        elif "shoprite" in lower_path: retailer_name = "Shoprite"
+    Only files that are new or changed since the last run (per the ingest
+    manifest) are read; products that disappeared from them are tombstoned.
+    `full=True` forgets the manifest so every file is ingested again. The
+    search index is updated as each batch lands. Returns the ingest report.
+    Raises mongo.LeaseHeld while another worker is ingesting.
+    """
+    with store.ingest_lease():
+        catch_up_with_other_workers()
+        if full:
+            store.manifest.delete_many({})
+        index = search_index
+        report = ingest.refresh_files(
+            store.products, store.manifest, tombstones_collection, index=index
+        )
+        if report["files"] or report["tombstoned"]:
+            store.bump_version()
+            # Updated in place during the refresh, so it is current
+            index.catalog_version = store.version
+    return report
+
+def catch_up_with_other_workers():
+    """Follow a swap or ingest another worker finished before this one took the lease."""
+    if store.sync():
+        rebuild_search_index()
 
+class ReseedRejected(Exception):
+    """A shadow generation failed validation and was discarded."""
+
+def validate_generation(collection, report: dict, index_names: List[str], force: bool = False) -> int:
+    """Check a freshly built generation before it goes live; returns its size."""
+    if report["errors"]:
+        raise ReseedRejected(f"Unreadable files: {', '.join(report['errors'])}")
+    count = collection.count_documents({})
+    if count == 0:
+        raise ReseedRejected("New generation is empty")
+    missing = set(index_names) - set(collection.index_information())
+    if missing:
+        raise ReseedRejected(f"Missing indexes: {', '.join(sorted(missing))}")
+    live_count = store.products.estimated_document_count()
+    if not force and count < live_count * RESEED_MIN_RATIO:
+        raise ReseedRejected(
+            f"New generation has {count} products vs {live_count} live (below {RESEED_MIN_RATIO:.0%})"
+        )
+    return count
+
+def rebuild_generation(force: bool = False) -> dict:
+    """Full reseed into a shadow collection, then swap it live.
+
+    Reads keep hitting the current generation (with its indexes) until the
+    new one is loaded, indexed and validated; the swap is a pointer change,
+    so there is no empty or index-less window. The replaced generation is
+    kept for /debug/rollback. Raises mongo.LeaseHeld while another worker
+    is ingesting.
+    """
+    global search_index
+    with store.ingest_lease():
+        catch_up_with_other_workers()
+        generation = store.new_generation()
+        shadow = store.db[generation]
+        index = SearchIndex()
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"⚠️ Error reading {filepath}: {e}")
-            continue
-
-        # Normalize data (handle list vs dict structures)
-        products_list = []
-        if isinstance(data, list):
-            products_list = data
-        elif isinstance(data, dict):
-            # Some scrapers might wrap list in a key
-            for v in data.values():
-                if isinstance(v, list):
-                    products_list.extend(v)
-
-        # Process and Upsert
-        for item in products_list:
-            name = item.get("name") or item.get("productName") or item.get("title")
-            if not name:
-                continue
-
-            # Standardize fields
-            price_val = parse_price(item.get("price") or item.get("price_str"))
-            buy_url = item.get("buy_url") or item.get("url") or item.get("productURL")
-            
-            doc = {
-                "productName": name,
-                "price": price_val,
-                "productImageURL": item.get("image") or item.get("productImageURL") or item.get("img"),
-                "productURL": buy_url,
-                "category": item.get("category") or item.get("department") or "Uncategorized",
-                "retailer": item.get("retailer") or retailer_name,
-                "updated_at": datetime.utcnow()
-            }
-
-            # Avoid duplicates: Update if exists, Insert if new
-            # Using 'buy_url' as unique key if present, otherwise 'name'
-            filter_query = {"productURL": buy_url} if buy_url else {"productName": name}
-            
-            result = products_collection.update_one(filter_query, {"$set": doc}, upsert=True)
-            if result.upserted_id:
-                seeded_count += 1
-
-    return seeded_count
+            report = ingest.refresh_files(
+                shadow, store.manifest_for(generation), tombstones_collection, index=index
+            )
+            # Built after the bulk load, which is cheaper than maintaining them row by row
+            index_names = ensure_product_indexes(shadow)
+            count = validate_generation(shadow, report, index_names, force=force)
+        except Exception:
+            store.drop_generation(generation)
+            raise
+
+        store.promote(generation)
+        index.catalog_version = store.version
+        search_index = index
+    print(f"🔁 Generation {generation} is live with {count} products (previous: {store.previous}).")
+    report["generation"] = generation
+    report["previous_generation"] = store.previous
+    report["count"] = count
+    return report
+
+def rollback_generation() -> str:
+    """Swap the previous generation back in; raises RuntimeError (or LeaseHeld)."""
+    with store.ingest_lease():
+        return store.rollback()
+
+def rebuild_search_index():
+    """Replace the search index with one built from the live generation."""
+    global search_index
+    index = SearchIndex()
+    # Read first: a version published while building is rebuilt next sync
+    index.catalog_version = store.version
+    indexed = index.rebuild(store.products.find({}, SEARCH_PROJECTION))
+    search_index = index
+    return indexed
 
 @app.on_event("startup")
 async def startup_event():
-    """Run seeding on startup if DB is empty."""
+    """Build the search index, then ingest any new or changed cleaned files."""
+    global generation_follower
     try:
-        count = products_collection.count_documents({})
+        await run_db(store.sync)
+        # The live generation is only known after sync
+        await run_db(ensure_product_indexes, store.products)
+        print(f"✅ Connected to MongoDB: {DB_NAME} / {store.active}")
+        products_collection = store.products
+        count = await run_db(store.products.count_documents, {})
         if count == 0:
             print("📦 Database is empty. Seeding from JSON files...")
-            new_items = seed_database_from_json()
-            print(f"🎉 Seeding complete! Added {new_items} new products.")
+            # A stale manifest would skip files whose rows are no longer here
+            async with ingest_lock:
+                report = await run_db(seed_database_from_json, full=True)
+            print(f"🎉 Seeding complete! Added {report['inserted']} new products.")
         else:
-            print(f"✓ Database ready with {count} products.")
+            print(f"✓ Database ready with {count} products ({store.active}).")
+            migrated = await run_db(ingest.migrate_legacy_ids, products_collection)
+            if migrated:
+                print(f"🔑 Re-keyed {migrated} products to deterministic ids.")
+            backfilled = await run_db(ingest.backfill_derived_fields, products_collection)
+            if backfilled:
+                print(f"🔤 Added filter keys / image ids / barcodes to {backfilled} products.")
+            # New barcodes can change the groups too
+            if backfilled or await run_db(store.products.find_one, {"matchGroup": {"$exists": False}}, {"_id": 1}):
+                matched = await run_db(matching.assign_match_groups, products_collection)
+                print(f"🔗 Assigned match groups to {matched} products.")
+                await run_db(store.bump_version)
+            indexed = await run_db(rebuild_search_index)
+            print(f"🔎 Search index built for {indexed} products.")
+            async with ingest_lock:
+                report = await run_db(seed_database_from_json)
+            if report["files"] or report["tombstoned"]:
+                print(f"🔄 Refreshed: {report['inserted']} new, {report['updated']} updated products.")
+        await warm_home()
+    except mongo.LeaseHeld as e:
+        # The other worker's catalog arrives through follow_generation_swaps
+        print(f"⏳ Skipped startup refresh: {e}")
     except Exception as e:
         print(f"✗ Startup Error: {e}")
+    generation_follower = asyncio.create_task(follow_generation_swaps())
+
+async def follow_generation_swaps():
+    """Re-point this worker when another process changes the catalog.
+
+    Covers promotions, rollbacks and incremental refreshes; cached
+    responses follow automatically since they are keyed on the catalog
+    version (see `catalog_version`).
+    """
+    while True:
+        await asyncio.sleep(STORE_SYNC_SECONDS)
+        try:
+            if await run_db(store.sync):
+                indexed = await run_db(rebuild_search_index)
+                print(f"🔁 Catalog v{store.version} on {store.active} ({indexed} products indexed).")
+                await warm_home()
+        except Exception as e:
+            print(f"⚠️ Could not check product generation: {e}")
+
+@app.on_event("startup")
+async def start_image_client():
+    """Open the shared keep-alive client used by the /image proxy."""
+    await image_proxy.start_client()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the MongoDB worker pool, its connections and the image client."""
+    if generation_follower is not None:
+        generation_follower.cancel()
+    await image_proxy.close_client()
+    mongo.shutdown()
 
 # ---------------------------------------------------------------------------
 # 6. SCRAPER BACKGROUND TASK
@@ -240,10 +693,14 @@ async def run_scrapy_spider(task_id: str):
         stdout, stderr = await process.communicate()
 
         if process.returncode == 0:
+            # Pull the changed cleaned files into MongoDB and the search index
+            async with ingest_lock:
+                await run_db(seed_database_from_json)
+            await warm_home()
             scrape_jobs[task_id]["status"] = "completed"
             scrape_jobs[task_id]["end_time"] = datetime.now().isoformat()
             # Try to count results if possible
-            scrape_jobs[task_id]["products_scraped"] = products_collection.count_documents({})
+            scrape_jobs[task_id]["products_scraped"] = await run_db(store.products.count_documents, {})
         else:
             scrape_jobs[task_id]["status"] = "failed"
             scrape_jobs[task_id]["error"] = stderr.decode()
@@ -266,28 +723,84 @@ async def root():
             "products": "/products",
             "retailers": "/retailers",
             "categories": "/categories",
-            "image": "/image?url=<encoded_url>"
+            "image": "/image?url=<encoded_url>[&w=200&fmt=webp]"
         }
     }
 
 @app.get("/image")
-async def serve_image(url: str):
+async def serve_image(url: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = None):
     """
     Proxy endpoint to fetch and serve product images.
-    Usage: GET /image?url=<URL-encoded-image-URL>
+    Usage: GET /image?url=<URL-encoded-image-URL>[&w=200][&fmt=webp]
+
+    `w` downsizes to a thumbnail width (rounded up to a standard size) and
+    `fmt` re-encodes as webp, jpeg or png; variants are built once and cached.
+
+    Images are served from the local cache when present; small ones come
+    from memory, larger ones are sent straight from disk. Responses carry
+    the real Content-Type plus ETag/Last-Modified, and conditional requests
+    get a 304.
     """
+    return await proxy_image(url, request, w, fmt)
+
+@app.get("/image/{image_id}")
+async def serve_image_by_id(image_id: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = None):
+    """Same as /image, for the short image ids used in product payloads."""
+    url = image_urls.get(image_id)
+    if url is None:
+        product = await run_db(
+            store.products.find_one, {"imageId": image_id}, {"productImageURL": 1}, max_time_ms=MONGO_MAX_TIME_MS
+        )
+        if not product or not product.get("productImageURL"):
+            raise HTTPException(status_code=404, detail="Unknown image id")
+        url = product["productImageURL"]
+        # Ids are hashes of the URL, so a resolved id never changes
+        image_urls[image_id] = url
+        if len(image_urls) > IMAGE_ID_CACHE_SIZE:
+            image_urls.pop(next(iter(image_urls)))
+    return await proxy_image(url, request, w, fmt)
+
+async def proxy_image(url: str, request: Request, w: Optional[int], fmt: Optional[str]) -> Response:
     if not url:
         raise HTTPException(status_code=400, detail="url parameter is required")
+    if w is not None and not 1 <= w <= 2000:
+        raise HTTPException(status_code=400, detail="w must be between 1 and 2000")
+    if fmt is not None and fmt.lower() not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(VARIANT_FORMATS)}")
     
-    image_bytes = await fetch_image_from_url(url)
-    if not image_bytes:
-        raise HTTPException(status_code=404, detail="Could not fetch image from URL")
-    
-    # Return image as binary stream with appropriate content-type
-    return StreamingResponse(
-        iter([image_bytes]),
-        media_type="image/jpeg",  # Adjust based on actual image type if needed
-        headers={"Cache-Control": "public, max-age=86400"}  # Cache for 24 hours
+    # A second attempt covers a body another worker evicted after lookup
+    # (the entry is forgotten, so the retry fetches it again)
+    for _ in range(2):
+        entry = await image_proxy.get_variant(url, w, fmt.lower() if fmt else None)
+        if entry is None:
+            break
+
+        headers = {
+            "Cache-Control": "public, max-age=86400",  # Cache for 24 hours
+            "ETag": entry.client_etag,
+        }
+        if entry.last_modified:
+            headers["Last-Modified"] = entry.last_modified
+
+        if is_not_modified(request.headers, entry.client_etag, entry.last_modified):
+            return Response(status_code=304, headers=headers)
+
+        if entry.size <= IMAGE_MEMORY_ITEM_MAX_BYTES:
+            body = await image_proxy.image_cache.read_body(entry)
+            if body is not None:
+                return Response(content=body, media_type=entry.content_type, headers=headers)
+        elif await image_proxy.image_cache.has_body(entry):
+            return FileResponse(
+                image_proxy.image_cache.body_path(entry.key),
+                media_type=entry.content_type,
+                headers=headers,
+            )
+
+    # Short client-side cache so the app does not immediately retry a dead link
+    raise HTTPException(
+        status_code=404,
+        detail="Could not fetch image from URL",
+        headers={"Cache-Control": f"public, max-age={image_proxy.IMAGE_NEGATIVE_TTL_TRANSIENT}"},
     )
 
 @app.get("/products", response_model=List[ProductOut])
@@ -295,65 +808,82 @@ async def get_products(
     search: Optional[str] = None,
     retailer: Optional[str] = None,
     category: Optional[str] = None,
+    sort: str = "asc",
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    request: Request = None,
 ):
     """
-    Search and filter products.
+    Search and filter products, ordered by price (`sort=asc|desc`).
+    Products without a price are always listed last.
+
+    Full pages carry an `X-Next-Cursor` header; pass it back as `cursor`
+    to fetch the next page at constant cost instead of using `skip`.
+
+    Pages are served from an in-process cache until the catalog changes,
+    and carry an ETag so a repeat request with If-None-Match gets a 304.
     """
-    query = {}
+    if sort not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="sort must be 'asc' or 'desc'")
 
-    # Case-insensitive Search across name fields and category
-    if search:
-        escaped = re.escape(search)
-        regex_expr = {"$regex": escaped, "$options": "i"}
-        # Match product name/title fields OR category so users can search by category name
-        query["$or"] = [
-            {"productName": regex_expr},
-            {"name": regex_expr},
-            {"title": regex_expr},
-            {"category": regex_expr},
-            {"retailer": regex_expr}
-        ]
-
-    # Filter by Retailer
-    if retailer:
-        query["retailer"] = {"$regex": f"^{re.escape(retailer)}$", "$options": "i"}
-    
-    # Filter by Category
-    if category:
-        query["category"] = {"$regex": f"^{re.escape(category)}$", "$options": "i"}
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, descending=(sort == "desc"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
 
-    # Fetch Data
-    cursor = products_collection.find(query).skip(skip).limit(limit)
-    
-    # Sort in Python to handle None values safely (put None price at end)
-    products = list(cursor)
-    products.sort(key=lambda x: (x.get("price") is None, x.get("price")))
+    # Spellings that return the same page share a cache entry
+    search_terms = search_terms_of(search)
+    retailer_key = normalize(retailer) if retailer else ""
+    category_key = normalize(category) if category else ""
+    cache_key = (search_terms, retailer_key, category_key, sort, skip, limit, cursor or "")
+    version = catalog_version()
+    etag = catalog_etag(version, "products", *cache_key)
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
 
-    # Add image proxy URLs to each product
-    for product in products:
-        add_image_proxy_url(product)
+    async def load_page() -> CachedResponse:
+        query = product_filter(search_terms, retailer_key, category_key)
+        if query is None:
+            return CachedResponse(body=b"[]")
 
-    return products
+        # Fetch Data (ordering and paging happen in MongoDB)
+        products = await run_db(
+            find_price_sorted, query, descending=(sort == "desc"), skip=skip, limit=limit, after=after
+        )
+
+        headers = {}
+        if limit and len(products) >= limit:
+            headers["X-Next-Cursor"] = encode_cursor(products[-1], descending=(sort == "desc"))
+
+        return CachedResponse(body=serialize_products(products), headers=headers)
+
+    page = await products_cache.get_or_compute(version, cache_key, load_page)
+    return catalog_response(request, etag, page)
 
 @app.get("/products/category/{category_name}", response_model=List[ProductOut])
-async def get_products_by_category_path(category_name: str):
+async def get_products_by_category_path(category_name: str, request: Request):
     """Shortcut endpoint for categories."""
-    return await get_products(category=category_name)
+    return await get_products(category=category_name, request=request)
 
 @app.get("/products/retailer/{retailer_name}", response_model=List[ProductOut])
-async def get_products_by_retailer_path(retailer_name: str):
+async def get_products_by_retailer_path(retailer_name: str, request: Request):
     """Shortcut endpoint for retailers."""
-    return await get_products(retailer=retailer_name)
+    return await get_products(retailer=retailer_name, request=request)
 
 
 @app.get("/products/search", response_model=List[ProductOut])
 async def search_product_and_retailer(
     product: Optional[str] = None,
     retailer: Optional[str] = None,
+    sort: str = "asc",
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    request: Request = None,
 ):
     """Search products by product name (or part of it) and retailer.
 
@@ -366,23 +896,150 @@ async def search_product_and_retailer(
         raise HTTPException(status_code=400, detail="Provide at least `product` or `retailer` parameter")
 
     # Delegate to the main get_products function which handles search/filters
-    return await get_products(search=product, retailer=retailer, skip=skip, limit=limit)
+    return await get_products(
+        search=product, retailer=retailer, sort=sort, skip=skip, limit=limit, cursor=cursor, request=request
+    )
+
+@app.get("/product/{product_id}", response_model=ProductOut)
+async def get_product(product_id: str):
+    """Return a single product by its product key (primary-key lookup)."""
+    product = await run_db(store.products.find_one, {"_id": product_id}, max_time_ms=MONGO_MAX_TIME_MS)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return shape_product(product)
+
+async def distinct_names(field: str) -> CachedResponse:
+    """[{"id", "name"}] for every distinct non-empty value of `field`, sorted."""
+    values = await run_db(store.products.distinct, field, maxTimeMS=MONGO_MAX_TIME_MS)
+    values = sorted(v for v in values if v)  # filter empty
+    return CachedResponse(body=json_dumps([{"id": i, "name": v} for i, v in enumerate(values)]))
 
 @app.get("/categories", response_model=List[dict])
-async def get_categories():
+async def get_categories(request: Request):
     """Return all unique categories found in DB."""
-    cats = products_collection.distinct("category")
-    cats = [c for c in cats if c] # filter empty
-    cats.sort()
-    return [{"id": i, "name": c} for i, c in enumerate(cats)]
+    version = catalog_version()
+    etag = catalog_etag(version, "categories")
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
+    page = await products_cache.get_or_compute(version, ("categories",), lambda: distinct_names("category"))
+    return catalog_response(request, etag, page)
 
 @app.get("/retailers", response_model=List[dict])
-async def get_retailers():
+async def get_retailers(request: Request):
     """Return all unique retailers found in DB."""
-    rets = products_collection.distinct("retailer")
-    rets = [r for r in rets if r]
-    rets.sort()
-    return [{"id": i, "name": r} for i, r in enumerate(rets)]
+    version = catalog_version()
+    etag = catalog_etag(version, "retailers")
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
+    page = await products_cache.get_or_compute(version, ("retailers",), lambda: distinct_names("retailer"))
+    return catalog_response(request, etag, page)
+
+@app.get("/facets")
+async def get_facets(
+    request: Request,
+    search: Optional[str] = None,
+    retailer: Optional[str] = None,
+    category: Optional[str] = None,
+):
+    """Categories, retailers and price bands with product counts.
+
+    Takes the same search/retailer/category parameters as /products so the
+    counts can follow the current selection. Computed with one aggregation
+    and cached per catalog version.
+    """
+    search_terms = search_terms_of(search)
+    retailer_key = normalize(retailer) if retailer else ""
+    category_key = normalize(category) if category else ""
+    cache_key = ("facets", search_terms, retailer_key, category_key)
+    version = catalog_version()
+    etag = catalog_etag(version, *cache_key)
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
+
+    async def load_facets() -> CachedResponse:
+        query = product_filter(search_terms, retailer_key, category_key)
+        # An unmatched search still lists every band, with zero counts
+        facets = await run_db(facet_counts, query if query is not None else {"_id": {"$in": []}})
+        return CachedResponse(body=json_dumps(facets))
+
+    page = await products_cache.get_or_compute(version, cache_key, load_facets)
+    return catalog_response(request, etag, page)
+
+async def home_bundle(version: Any) -> CachedResponse:
+    async def load_home() -> CachedResponse:
+        return CachedResponse(body=json_dumps(await run_db(build_home_bundle)))
+    return await home_cache.get_or_compute(version, "home", load_home)
+
+async def warm_home():
+    """Materialize the /home bundle for the current catalog version ahead of requests."""
+    try:
+        await home_bundle(catalog_version())
+    except Exception as e:
+        print(f"⚠️ Could not prepare /home bundle: {e}")
+
+@app.get("/home")
+async def get_home(request: Request):
+    """Home screen in one request: categories and retailers with counts,
+    quick-search results and recommended products.
+
+    Built once per catalog version (ahead of time after every catalog
+    change) and served from memory.
+    """
+    version = catalog_version()
+    etag = catalog_etag(version, "home")
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
+    return catalog_response(request, etag, await home_bundle(version))
+
+async def product_group_response(request: Request, cache_key: tuple, query: dict, detail: str):
+    """Products matching `query` (one product across retailers), cheapest first; 404 if none."""
+    version = catalog_version()
+    etag = catalog_etag(version, *cache_key)
+    held = catalog_not_modified(request, etag)
+    if held:
+        return catalog_response(request, held, None)
+
+    async def load_group() -> CachedResponse:
+        products = await run_db(
+            lambda: list(
+                store.products.find(query, PRODUCT_PROJECTION)
+                .sort("price", ASCENDING)
+                .max_time_ms(MONGO_MAX_TIME_MS)
+            )
+        )
+        if not products:
+            raise HTTPException(status_code=404, detail=detail)
+        # Unpriced offers sort first in MongoDB; list them last
+        products.sort(key=lambda p: p.get("price") is None)
+        return CachedResponse(body=json_dumps({
+            cache_key[0]: cache_key[1],
+            "retailers": len({p.get("retailer") for p in products}),
+            "products": [shape_product(p) for p in products],
+        }))
+
+    page = await products_cache.get_or_compute(version, cache_key, load_group)
+    return catalog_response(request, etag, page)
+
+@app.get("/compare/{group_id}")
+async def compare_group(group_id: str, request: Request):
+    """The same product across retailers (a match group), cheapest first."""
+    return await product_group_response(
+        request, ("group", group_id), {"matchGroup": group_id}, "Match group not found"
+    )
+
+@app.get("/products/by-barcode/{gtin}")
+async def products_by_barcode(gtin: str, request: Request):
+    """Every retailer's offer for one barcode (EAN-8/13, UPC-A or GTIN-14), cheapest first."""
+    canonical = barcodes.normalize_gtin(gtin)
+    if canonical is None:
+        raise HTTPException(status_code=400, detail="Not a valid GTIN (8, 12, 13 or 14 digits with check digit)")
+    return await product_group_response(
+        request, ("gtin", canonical), {"gtin": canonical}, "No products with this barcode"
+    )
 
 # --- Scraper Endpoints ---
 
@@ -426,19 +1083,75 @@ async def get_job_status(task_id: str):
 # --- Debug Endpoints ---
 
 @app.post("/debug/reseed")
-async def debug_reseed():
-    """Clears DB and re-runs seeding from JSON files."""
+async def debug_reseed(full: bool = True, force: bool = False):
+    """Re-runs seeding from JSON files.
+
+    By default rebuilds every product into a new generation and swaps it in
+    once validated (`force=true` skips the shrink check); `full=false` only
+    ingests files that changed since the last run, in place.
+    """
     try:
-        deleted = products_collection.delete_many({})
-        seeded = seed_database_from_json()
-        return {
+        async with ingest_lock:
+            if full:
+                previous_count = await run_db(store.products.estimated_document_count)
+                report = await run_db(rebuild_generation, force)
+            else:
+                report = await run_db(seed_database_from_json)
+        await warm_home()
+        result = {
             "status": "success", 
-            "deleted_count": deleted.deleted_count, 
-            "seeded_count": seeded
+            "seeded_count": report["inserted"],
+            "updated_count": report["updated"],
+            "tombstoned_count": report["tombstoned"],
+            "skipped_files": report["skipped"],
+            "files": report["files"]
         }
+        if full:
+            result.update(
+                generation=report["generation"],
+                previous_generation=report["previous_generation"],
+                previous_count=previous_count,
+            )
+        return result
+    except ReseedRejected as e:
+        raise HTTPException(status_code=409, detail=f"Reseed rejected, live data unchanged: {e}")
+    except mongo.LeaseHeld as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/debug/rollback")
+async def debug_rollback():
+    """Swap the previous product generation back in (undoes the last full reseed)."""
+    async with ingest_lock:
+        try:
+            active = await run_db(rollback_generation)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        indexed = await run_db(rebuild_search_index)
+    await warm_home()
+    return {"status": "success", "generation": active, "previous_generation": store.previous, "indexed": indexed}
+
+@app.get("/debug/cache-stats")
+async def debug_cache_stats():
+    """Response cache counters and the catalog version it is serving."""
+    return {
+        "catalog_version": store.version,
+        "generation": store.active,
+        "products": products_cache.info(),
+        "home": home_cache.info(),
+    }
+
+@app.get("/debug/image-stats")
+async def debug_image_stats():
+    """Image proxy counters (cache hits, upstream fetches, coalesced waits, failures)."""
+    return {
+        **image_proxy.proxy_stats,
+        "cache": image_proxy.image_cache.stats(),
+        "negative_cache_entries": len(image_proxy.negative_cache),
+        "open_circuits": image_proxy.breaker.open_hosts(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=True)
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Cross-retailer product matching for the Compare page.
+
+Products with the same barcode (or the same SKU within one SKU catalogue,
+see barcodes.py) are grouped directly. For the rest, every product is
+reduced to a normalized name (house-brand markers and pack-size text
+removed) and a pack signature such as "6x1000ml" or "750ml". Products are
+only compared within the same pack signature (blocking), and within a
+block only when they share a reasonably rare name token; two products
+with different barcodes are never compared, nor are names that differ in
+a variant word (battery size, flavour, fat content: "AA" vs "AAA",
+"mint"). Candidate pairs are scored by TF-IDF cosine similarity; pairs
+above the threshold are merged greedily, best first, onto the exact
+groups. A match group holds at most one product per retailer.
+
+Each grouped product gets a `matchGroup` id, served by /compare/{group}.
+"""
+import hashlib
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from barcodes import exact_key
+from search_index import normalize
+
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.55"))
+# Products without a recognisable pack size need a closer name match
+MATCH_THRESHOLD_NO_PACK = float(os.getenv("MATCH_THRESHOLD_NO_PACK", "0.8"))
+# Tokens shared by more products than this within a block do not create
+# candidate pairs on their own (e.g. "milk" among all 1L products)
+MATCH_MAX_TOKEN_BLOCK = int(os.getenv("MATCH_MAX_TOKEN_BLOCK", "200"))
+
+# Words retailers use for their own labels; dropped so a house-brand
+# product can match the branded equivalent on its description
+HOUSE_BRAND_TOKENS = {"pnp", "checkers", "housebrand", "ritebrand", "shoprite", "woolworths", "ww"}
+# Words that tell variants of one product line apart; names that differ in
+# one of them are different products however similar the rest is
+VARIANT_TOKENS = {
+    "aa", "aaa", "aaaa", "c", "d", "9v",
+    "mint", "spearmint", "peppermint", "menthol", "charcoal", "whitening", "sensitive", "herbal",
+    "strawberry", "vanilla", "chocolate", "caramel", "lemon", "lime", "orange", "apple", "berry",
+    "banana", "cherry", "grape", "peach", "mango", "pineapple", "coconut", "cinnamon", "honey",
+    "lavender", "rose", "aloe",
+    "skim", "low", "fat", "lite", "light", "diet", "zero", "decaf", "salted", "unsalted",
+}
+_STOPWORDS = {"and", "with", "the", "of", "for", "in", "x", "pack", "pk", "each", "ea"}
+
+_UNITS = {
+    "ml": ("ml", 1), "l": ("ml", 1000), "lt": ("ml", 1000), "ltr": ("ml", 1000),
+    "litre": ("ml", 1000), "litres": ("ml", 1000), "liter": ("ml", 1000),
+    "g": ("g", 1), "gr": ("g", 1), "gram": ("g", 1), "grams": ("g", 1), "kg": ("g", 1000),
+}
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_UNIT = r"(ml|litres|litre|liter|ltr|lt|l|kg|grams|gram|gr|g)"
+_MULTI_RE = re.compile(rf"(\d+)\s*x\s*{_NUMBER}\s*{_UNIT}\b")
+_SINGLE_RE = re.compile(rf"{_NUMBER}\s*{_UNIT}\b")
+_COUNT_RE = re.compile(r"(\d+)\s*-?\s*(?:pack|pk|pcs|pieces|rolls|tray|s)\b")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def pack_signature(name: str) -> Optional[str]:
+    """Canonical pack size of a product name, e.g. "6x1000ml", "750ml", "30ea"."""
+    text = normalize(name)
+    match = _MULTI_RE.search(text)
+    if match:
+        count, amount, unit = match.groups()
+        base, factor = _UNITS[unit]
+        return f"{int(count)}x{_amount(amount, factor)}{base}"
+    match = _SINGLE_RE.search(text)
+    if match:
+        amount, unit = match.groups()
+        base, factor = _UNITS[unit]
+        return f"{_amount(amount, factor)}{base}"
+    match = _COUNT_RE.search(text)
+    if match:
+        return f"{int(match.group(1))}ea"
+    return None
+
+
+def _amount(amount: str, factor: int) -> str:
+    value = float(amount.replace(",", ".")) * factor
+    return f"{value:g}"
+
+
+def name_tokens(name: str) -> List[str]:
+    """Descriptive tokens of a product name: no pack sizes, units or house-brand words."""
+    text = normalize(name)
+    for pattern in (_MULTI_RE, _SINGLE_RE, _COUNT_RE):
+        text = pattern.sub(" ", text)
+    # "Grand-Pa" and "Grandpa" are the same brand
+    text = re.sub(r"(?<=[a-z])-(?=[a-z])", "", text)
+    return [
+        token for token in _TOKEN_RE.findall(text)
+        if token not in HOUSE_BRAND_TOKENS and token not in _STOPWORDS and not token.isdigit()
+    ]
+
+
+def variant_conflict(a: Iterable[str], b: Iterable[str]) -> bool:
+    """True when two token lists differ in a variant word."""
+    return bool((set(a) ^ set(b)) & VARIANT_TOKENS)
+
+
+def group_id(member_ids: Iterable[str]) -> str:
+    """Stable id of a match group, derived from its smallest product key."""
+    anchor = min(str(member) for member in member_ids)
+    return "g" + hashlib.sha1(anchor.encode("utf-8")).hexdigest()[:12]
+
+
+def _tfidf(docs: Dict[str, List[str]]) -> Dict[str, Dict[str, float]]:
+    """Unit-length TF-IDF vectors (sparse dicts) for tokenized names."""
+    df: Dict[str, int] = defaultdict(int)
+    for tokens in docs.values():
+        for token in set(tokens):
+            df[token] += 1
+    n = len(docs)
+    vectors = {}
+    for doc_id, tokens in docs.items():
+        weights: Dict[str, float] = defaultdict(float)
+        for token in tokens:
+            weights[token] += math.log((1 + n) / (1 + df[token])) + 1
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        vectors[doc_id] = {token: w / norm for token, w in weights.items()}
+    return vectors
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(token, 0.0) for token, weight in a.items())
+
+
+def find_groups(products: List[dict]) -> Dict[str, str]:
+    """Map product _id -> match group id for every product that has a match.
+
+    `products` need `_id`, `productName` and `retailer`; `gtin` / `sku`
+    (and `retailer_key`) are used when present.
+    """
+    retailer_of = {p["_id"]: p.get("retailer") for p in products}
+    gtin_of = {p["_id"]: p.get("gtin") for p in products}
+    tokens = {p["_id"]: name_tokens(p.get("productName", "")) for p in products}
+    vectors = _tfidf(tokens)
+
+    blocks: Dict[Optional[str], List[str]] = defaultdict(list)
+    for p in products:
+        blocks[pack_signature(p.get("productName", ""))].append(p["_id"])
+
+    pairs: List[Tuple[float, str, str]] = []
+    for signature, members in blocks.items():
+        threshold = MATCH_THRESHOLD if signature else MATCH_THRESHOLD_NO_PACK
+        postings: Dict[str, List[str]] = defaultdict(list)
+        for doc_id in members:
+            for token in set(tokens[doc_id]):
+                postings[token].append(doc_id)
+
+        seen: Set[Tuple[str, str]] = set()
+        for token, ids in postings.items():
+            if len(ids) < 2 or len(ids) > MATCH_MAX_TOKEN_BLOCK:
+                continue
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    # Equal barcodes are grouped below; different ones are different products
+                    if retailer_of[a] == retailer_of[b] or (gtin_of[a] and gtin_of[b]):
+                        continue
+                    pair = (a, b) if str(a) < str(b) else (b, a)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    score = _cosine(vectors[a], vectors[b])
+                    if score >= threshold and not variant_conflict(tokens[a], tokens[b]):
+                        pairs.append((score, *pair))
+
+    # Exact keys first, then fuzzy pairs best first; a group never holds
+    # two products of the same retailer
+    parent = {doc_id: doc_id for doc_id in retailer_of}
+    retailers = {doc_id: {retailer_of[doc_id]} for doc_id in retailer_of}
+    gtins = {doc_id: {gtin_of[doc_id]} - {None} for doc_id in retailer_of}
+
+    def root(doc_id):
+        while parent[doc_id] != doc_id:
+            parent[doc_id] = parent[parent[doc_id]]
+            doc_id = parent[doc_id]
+        return doc_id
+
+    def union(a, b):
+        ra, rb = root(a), root(b)
+        if ra == rb or retailers[ra] & retailers[rb]:
+            return
+        # Fuzzy links must not chain two different barcodes together
+        if gtins[ra] and gtins[rb] and gtins[ra] != gtins[rb]:
+            return
+        parent[rb] = ra
+        retailers[ra] |= retailers.pop(rb)
+        gtins[ra] |= gtins.pop(rb)
+
+    first_with_key: Dict[str, str] = {}
+    for p in products:
+        key = exact_key(p)
+        if key:
+            union(first_with_key.setdefault(key, p["_id"]), p["_id"])
+    for _, a, b in sorted(pairs, key=lambda pair: -pair[0]):
+        union(a, b)
+
+    members: Dict[str, List[str]] = defaultdict(list)
+    for doc_id in retailer_of:
+        members[root(doc_id)].append(doc_id)
+    groups = {}
+    for ids in members.values():
+        if len(ids) > 1:
+            gid = group_id(ids)
+            for doc_id in ids:
+                groups[doc_id] = gid
+    return groups
+
+
+def assign_match_groups(collection, batch_size: int = 1000) -> int:
+    """Recompute match groups for the whole collection; returns products changed."""
+    fields = ("productName", "retailer", "retailer_key", "gtin", "sku", "matchGroup")
+    products = list(collection.find({}, {field: 1 for field in fields}))
+    groups = find_groups(products)
+
+    changed = 0
+    ops = []
+    for product in products:
+        group = groups.get(product["_id"])
+        # Unmatched products still get an explicit None, so startup can
+        # tell "never grouped" apart from "no match"
+        if "matchGroup" in product and product["matchGroup"] == group:
+            continue
+        ops.append(UpdateOne({"_id": product["_id"]}, {"$set": {"matchGroup": group}}))
+        if len(ops) >= batch_size:
+            changed += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        changed += collection.bulk_write(ops, ordered=False).modified_count
+    return changed
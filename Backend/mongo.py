@@ -0,0 +1,223 @@
+"""
+MongoDB data-access layer for the API.
+
+pymongo is synchronous, so every call made on behalf of a request goes
+through `run_db`, which executes it on a bounded thread pool instead of the
+event loop. A slow query then only occupies one pool thread and cannot stall
+unrelated requests such as /image traffic.
+
+Products live in generations: a full reseed builds a new collection next to
+the live one and `ProductStore.promote` switches reads over in one step,
+keeping the previous generation for rollback. Handlers therefore read
+`store.products` at call time instead of holding a collection object.
+"""
+import asyncio
+import functools
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = os.getenv("MONGO_DB")
+COLLECTION_NAME = os.getenv("MONGO_COLLECTION")
+
+# Connection pool and query limits (all overridable through .env)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_TIME_MS = int(os.getenv("MONGO_MAX_TIME_MS", "5000"))
+# Threads that may block on MongoDB at once; more would only queue for a socket
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(MONGO_MAX_POOL_SIZE)))
+# Lifetime of the ingest lease; a holder that crashed loses it after this,
+# so it must exceed the slowest full reseed
+INGEST_LEASE_SECONDS = int(os.getenv("INGEST_LEASE_SECONDS", "1800"))
+
+client = None
+db = None
+# Removed products, shared by every generation
+tombstones_collection = None
+
+try:
+    client = MongoClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+    )
+    db = client[DB_NAME]
+    tombstones_collection = db[f"{COLLECTION_NAME}_tombstones"]
+except Exception as e:
+    print(f"❌ Could not create MongoDB client: {e}")
+
+
+class LeaseHeld(RuntimeError):
+    """Another process holds the ingest lease."""
+
+
+class ProductStore:
+    """Tracks which collection generation serves products.
+
+    The pointer is kept in the `<collection>_meta` document so every worker
+    process agrees on it; `sync` re-reads it. Until the first swap the live
+    generation is COLLECTION_NAME itself. Each generation has its own ingest
+    manifest (`<generation>_manifest`).
+
+    `version` is the catalog version: a counter bumped whenever the served
+    products change (ingest, swap, rollback), which response caches key on.
+    """
+
+    META_ID = "generations"
+    VERSION_ID = "catalog"
+    LEASE_ID = "ingest_lease"
+
+    def __init__(self, database, base_name: str):
+        self.db = database
+        self.base_name = base_name
+        self.active = base_name
+        self.previous: Optional[str] = None
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def meta(self):
+        return self.db[f"{self.base_name}_meta"]
+
+    @property
+    def products(self):
+        return self.db[self.active]
+
+    @property
+    def manifest(self):
+        return self.manifest_for(self.active)
+
+    def manifest_for(self, generation: str):
+        return self.db[f"{generation}_manifest"]
+
+    def sync(self) -> bool:
+        """Pick up changes made by another process.
+
+        True if the live generation or the catalog version moved.
+        """
+        docs = {doc["_id"]: doc for doc in self.meta.find({"_id": {"$in": [self.META_ID, self.VERSION_ID]}})}
+        pointer = docs.get(self.META_ID, {})
+        active = pointer.get("active", self.base_name)
+        version = docs.get(self.VERSION_ID, {}).get("version", 0)
+        with self._lock:
+            moved = active != self.active or version != self.version
+            self.active, self.previous = active, pointer.get("previous")
+            self.version = version
+        return moved
+
+    def bump_version(self) -> int:
+        """Record that the served products changed; returns the new version."""
+        doc = self.meta.find_one_and_update(
+            {"_id": self.VERSION_ID}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self.version = doc["version"]
+        return self.version
+
+    def acquire_lease(self, owner: str, seconds: int = INGEST_LEASE_SECONDS) -> bool:
+        """Take (or extend) the ingest lease unless another owner holds a live one."""
+        now = datetime.utcnow()
+        try:
+            self.meta.find_one_and_update(
+                {"_id": self.LEASE_ID, "$or": [{"expires_at": {"$lte": now}}, {"owner": owner}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The lease document exists and belongs to someone else
+            return False
+        return True
+
+    def release_lease(self, owner: str):
+        self.meta.delete_one({"_id": self.LEASE_ID, "owner": owner})
+
+    @contextmanager
+    def ingest_lease(self, seconds: int = INGEST_LEASE_SECONDS):
+        """Hold the ingest lease for the block; raises LeaseHeld if it is taken.
+
+        Ingest, reseed and rollback write the catalog from whichever worker
+        runs them; the lease (a document in the meta collection) keeps two
+        processes from doing so at once.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if not self.acquire_lease(owner, seconds):
+            raise LeaseHeld("Another worker is ingesting; try again later")
+        try:
+            yield
+        finally:
+            self.release_lease(owner)
+
+    def new_generation(self) -> str:
+        """Name for a shadow generation (any leftover of the same name is dropped)."""
+        stamp = f"{self.base_name}_{datetime.utcnow():%Y%m%d%H%M%S}"
+        name, n = stamp, 1
+        while name in (self.active, self.previous):
+            n += 1
+            name = f"{stamp}_{n}"
+        self.drop_generation(name)
+        return name
+
+    def promote(self, generation: str):
+        """Make `generation` live; the current one becomes the rollback target.
+
+        The generation that was kept for rollback until now is dropped.
+        """
+        with self._lock:
+            retired = self.previous
+            self.meta.replace_one(
+                {"_id": self.META_ID},
+                {"active": generation, "previous": self.active, "promoted_at": datetime.utcnow()},
+                upsert=True,
+            )
+            self.active, self.previous = generation, self.active
+        self.bump_version()
+        if retired and retired not in (self.active, self.previous):
+            self.drop_generation(retired)
+
+    def rollback(self) -> str:
+        """Swap the live and previous generations back. Returns the live one."""
+        with self._lock:
+            if not self.previous or self.previous not in self.db.list_collection_names():
+                raise RuntimeError("No previous generation to roll back to")
+            self.meta.replace_one(
+                {"_id": self.META_ID},
+                {"active": self.previous, "previous": self.active, "promoted_at": datetime.utcnow()},
+                upsert=True,
+            )
+            self.active, self.previous = self.previous, self.active
+        self.bump_version()
+        return self.active
+
+    def drop_generation(self, generation: str):
+        self.db.drop_collection(generation)
+        self.db.drop_collection(f"{generation}_manifest")
+
+
+store = ProductStore(db, COLLECTION_NAME) if db is not None else None
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="mongo")
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking database call on the Mongo thread pool and await it."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    """Stop the worker pool and close client sockets (app shutdown)."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+    if client is not None:
+        client.close()
@@ -0,0 +1,95 @@
+"""
+In-process cache of serialized API responses.
+
+Entries are tagged with the catalog version they were computed from
+(`ProductStore.version`, bumped whenever ingest changes the products), so a
+seed, reseed or rollback invalidates exactly the responses it affects. The
+TTL is only a backstop for writes made behind the API's back. Concurrent
+misses for the same key share one computation.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from single_flight import SingleFlight
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.monotonic)
+    # Compressed copies of `body` by content coding, filled on first use
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class ResponseCache:
+    """LRU + TTL cache of CachedResponse objects for one catalog version."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version: Any = None
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+        self._inflight = SingleFlight(self.stats)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_version(self, version: Any):
+        if version != self.version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, version: Any, key: Hashable):
+        self._check_version(version)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, version: Any, key: Hashable, entry: CachedResponse):
+        # A computation that straddled a version bump is not cached
+        if version != self.version:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self, version: Any, key: Hashable, compute: Callable[[], Awaitable[CachedResponse]]
+    ) -> CachedResponse:
+        """Cached entry for `key`, or the result of one shared `compute()`."""
+        entry = self.get(version, key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+
+        flight_key = (version, key)
+        if flight_key not in self._inflight:
+            self.stats["misses"] += 1
+        return await self._inflight.run(flight_key, lambda: self._compute(version, key, compute))
+
+    async def _compute(self, version: Any, key: Hashable, compute) -> CachedResponse:
+        entry = await compute()
+        self.put(version, key, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def info(self) -> Dict[str, Any]:
+        return {"version": self.version, "entries": len(self._entries), **self.stats}
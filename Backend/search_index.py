@@ -0,0 +1,143 @@
+"""
+In-memory inverted index for product search.
+
+The index is built from MongoDB at startup and kept current by the seeding
+code, so search-bar queries resolve to a set of product ids from posting
+lists instead of a regex scan over every document.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Set
+
+# Fields tokenized into the index (document keys as stored by seeding)
+INDEXED_FIELDS = ("productName", "category", "retailer")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: Any) -> str:
+    """Lowercase and strip accents so 'Crème' and 'creme' index the same."""
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+
+def tokenize(text: Any) -> List[str]:
+    """Split text into normalized alphanumeric terms."""
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    """Posting lists of product ids keyed by term.
+
+    Terms are kept in a sorted vocabulary so prefix queries are a bisect
+    plus a short walk rather than a scan over every term.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Set[Any]] = {}
+        self._vocabulary: List[str] = []
+        self._doc_terms: Dict[Any, Set[str]] = {}
+        # Catalog version the contents reflect (maintained by the API)
+        self.catalog_version: Any = None
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    # --- Writes ---
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._vocabulary.clear()
+            self._doc_terms.clear()
+
+    def rebuild(self, docs: Iterable[dict]) -> int:
+        """Replace the whole index with the given documents."""
+        with self._lock:
+            self.clear()
+            for doc in docs:
+                self.add(doc)
+            return len(self._doc_terms)
+
+    def add(self, doc: dict):
+        """Index (or re-index) one product document. Requires `_id`."""
+        doc_id = doc.get("_id")
+        if doc_id is None:
+            return
+
+        terms = set()
+        for field in INDEXED_FIELDS:
+            terms.update(tokenize(doc.get(field)))
+
+        with self._lock:
+            self.remove(doc_id)
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = set()
+                    bisect.insort(self._vocabulary, term)
+                posting.add(doc_id)
+            self._doc_terms[doc_id] = terms
+
+    def remove(self, doc_id: Any):
+        """Drop a product from every posting list it appears in."""
+        with self._lock:
+            for term in self._doc_terms.pop(doc_id, ()):
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[term]
+                    pos = bisect.bisect_left(self._vocabulary, term)
+                    if pos < len(self._vocabulary) and self._vocabulary[pos] == term:
+                        del self._vocabulary[pos]
+
+    # --- Reads ---
+
+    def _prefix_ids(self, prefix: str) -> Set[Any]:
+        ids: Set[Any] = set()
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            ids |= self._postings[term]
+        return ids
+
+    def search(self, query: str) -> Set[Any]:
+        """Return ids of products matching every term of the query.
+
+        All terms must match exactly except the last, which is treated as a
+        prefix so results keep up with the user while they type.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return set()
+
+        with self._lock:
+            candidates: List[Set[Any]] = []
+            for term in terms[:-1]:
+                posting = self._postings.get(term)
+                if not posting:
+                    return set()
+                candidates.append(posting)
+
+            last = self._prefix_ids(terms[-1])
+            if not last:
+                return set()
+            candidates.append(last)
+
+            # Intersect smallest posting lists first
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for posting in candidates[1:]:
+                result &= posting
+                if not result:
+                    break
+            return result
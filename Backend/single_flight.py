@@ -0,0 +1,38 @@
+"""
+Request coalescing for async work keyed by what it produces.
+
+The image proxy (one upstream fetch per URL) and the response cache (one
+MongoDB query per page) both let concurrent callers for the same key
+share a single task rather than each doing the work.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """At most one running task per key; later callers await the same one."""
+
+    def __init__(self, stats: Optional[Dict[str, int]] = None):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        # Counts callers that joined a running task under stats["coalesced"]
+        self.stats = stats
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, key: Hashable, start: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `start()`, started only if no task for `key` is running."""
+        task = self._tasks.get(key)
+        if task is not None:
+            if self.stats is not None:
+                self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(start())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+
+        # Shielded so one client disconnecting does not cancel the shared work
+        return await asyncio.shield(task)
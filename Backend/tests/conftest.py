@@ -0,0 +1,59 @@
+"""
+Test setup: the API runs against mongomock instead of a MongoDB server.
+
+The environment and the MongoClient patch must be in place before `main`
+(and `mongo`) are imported, so this module does it at import time.
+"""
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost")
+os.environ.setdefault("MONGO_DB", "price_comp_test")
+os.environ.setdefault("MONGO_COLLECTION", "products")
+pymongo.MongoClient = mongomock.MongoClient
+
+# mongomock lags pymongo's signatures for a few calls the app makes
+_distinct = mongomock.collection.Collection.distinct
+mongomock.collection.Collection.distinct = (
+    lambda self, key, filter=None, session=None, **kwargs: _distinct(self, key, filter, session)
+)
+for _name in ("add_update", "add_replace"):
+    def _without_sort(original):
+        return lambda self, *args, sort=None, **kwargs: original(self, *args, **kwargs)
+    setattr(
+        mongomock.collection.BulkOperationBuilder, _name,
+        _without_sort(getattr(mongomock.collection.BulkOperationBuilder, _name)),
+    )
+
+
+@pytest.fixture
+def main_module():
+    """`main` with an empty live generation, search index and response caches."""
+    import main
+    main.store.sync()
+    main.store.products.delete_many({})
+    main.store.manifest.delete_many({})
+    main.tombstones_collection.delete_many({})
+    main.products_cache.clear()
+    main.home_cache.clear()
+    main.rebuild_search_index()
+    return main
+
+
+@pytest.fixture
+def client(main_module):
+    """TestClient without the startup hook (no seeding from the cleaned files)."""
+    from fastapi.testclient import TestClient
+    return TestClient(main_module.app)
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.products
@@ -0,0 +1,95 @@
+import pytest
+
+from barcodes import exact_key, extract_gtin, extract_sku, gtin_check_digit_ok, normalize_gtin
+from test_products import load, make_product
+
+# Product and image URLs as they appear in the cleaned scraper files
+PNP_URL = "https://www.pnp.co.za/All-Products/Beverages/Long-Life-Milk/UHT-Milk/Full-Cream/clover-uht-full-cream-long-life-milk-6-x-1l/p/000000000000538315_CS"
+PNP_IMAGE = "https://cdn-prd-02.pnp.co.za/sys-master/images/h4e/hb5/11491489710110/silo-product-image-v2-26Sep2024-180138-6001299015205-Straight_on-251327-185_400Wx400H"
+WOOLWORTHS_URL = "https://www.woolworths.co.za/prod/Food/Toiletries-Health/Health-Pharmacy/Medical/Calpol-Paediatric-Syrup-100-ml/_/A-6001424000021?isFromPLP=true"
+WOOLWORTHS_IMAGE = "https://assets.woolworthsstatic.co.za/Calpol-Paediatric-Syrup-100-ml-6001424000021.jpg?V=0Iyr"
+CHECKERS_URL = "https://www.checkers.co.za/product/energizer-max-aaa-alkaline-batteries-12-pack-10689259EA"
+CHECKERS_IMAGE = "https://catalog.sixty60.co.za/files/6866eed8d234e2cd0bca6590"
+SHOPRITE_URL = "https://www.shoprite.co.za/All-Departments/Food/Food-Cupboard/Long-Life-Milk-and-Dairy-Alternatives/Ritebrand-Long-Life-Full-Cream-Milk-6-x-1L-/p/10156109PK1"
+SHOPRITE_IMAGE = "https://www.shoprite.co.za/medias/lqi-checkers300Wx300H-medias-10156109PK1-en-shopriteGlobalProductCatalog-20240913110852.png"
+
+
+@pytest.mark.parametrize("digits, valid", [
+    ("6001299015205", True),
+    ("6001299015206", False),
+    ("036000291452", True),
+    ("036000291453", False),
+    ("96385074", True),
+    ("96385075", False),
+    ("10012345678902", True),
+    ("10012345678903", False),
+])
+def test_gtin_check_digit(digits, valid):
+    assert gtin_check_digit_ok(digits) is valid
+
+
+@pytest.mark.parametrize("value, canonical", [
+    # EAN-13 is canonical as-is
+    ("6001299015205", "6001299015205"),
+    ("600-1299 015205", "6001299015205"),
+    # UPC-A and EAN-8 are zero-padded to 13 digits
+    ("036000291452", "0036000291452"),
+    ("96385074", "0000096385074"),
+    # GTIN-14: the leading zero of an EAN-13 is dropped, a packaging indicator kept
+    ("06001299015205", "6001299015205"),
+    ("10012345678902", "10012345678902"),
+    (6001299015205, "6001299015205"),
+    # Bad check digit, wrong length, not digits
+    ("6001299015206", None),
+    ("1234567", None),
+    ("600129901520A", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_gtin(value, canonical):
+    assert normalize_gtin(value) == canonical
+
+
+@pytest.mark.parametrize("doc, gtin, sku", [
+    ({"productURL": PNP_URL, "productImageURL": PNP_IMAGE}, "6001299015205", "000000000000538315_CS"),
+    ({"productURL": WOOLWORTHS_URL, "productImageURL": CHECKERS_IMAGE}, "6001424000021", "6001424000021"),
+    ({"productURL": "https://www.woolworths.co.za/prod/x", "productImageURL": WOOLWORTHS_IMAGE}, "6001424000021", None),
+    ({"productURL": CHECKERS_URL, "productImageURL": CHECKERS_IMAGE}, None, "10689259EA"),
+    ({"productURL": SHOPRITE_URL, "productImageURL": SHOPRITE_IMAGE}, None, "10156109PK1"),
+    # The PnP pattern only applies on PnP hosts, and a scraped field wins over the URL
+    ({"productImageURL": PNP_IMAGE.replace("pnp.co.za", "example.com")}, None, None),
+    ({"gtin": "036000291452", "sku": " ab12 ", "productURL": PNP_URL}, "0036000291452", "AB12"),
+])
+def test_extract_from_retailer_urls(doc, gtin, sku):
+    assert extract_gtin(doc) == gtin
+    assert extract_sku(doc) == sku
+
+
+def test_exact_key_prefers_gtin_and_scopes_skus():
+    assert exact_key({"gtin": "6001299015205", "sku": "X1", "retailer": "Pick n Pay"}) == "gtin:6001299015205"
+    checkers = exact_key({"sku": "10156109PK1", "retailer": "Checkers"})
+    assert checkers == exact_key({"sku": "10156109PK1", "retailer": "Shoprite"})
+    assert checkers != exact_key({"sku": "10156109PK1", "retailer": "Pick n Pay"})
+    assert exact_key({"retailer": "Checkers"}) is None
+
+
+def test_products_by_barcode(main_module, client):
+    main = main_module
+    load(main, [
+        make_product(main, "Clover Milk 6 x 1L", 99.99, retailer="Pick n Pay", productURL=PNP_URL, productImageURL=PNP_IMAGE),
+        make_product(main, "Clover Full Cream 6x1L", 94.99, retailer="Checkers", gtin="6001299015205"),
+        make_product(main, "Calpol Syrup 100ml", 60.0, retailer="Woolworths", productURL=WOOLWORTHS_URL),
+    ])
+
+    assert client.get("/products/by-barcode/6001299015206").status_code == 400
+    assert client.get("/products/by-barcode/not-a-code").status_code == 400
+    assert client.get("/products/by-barcode/4006381333931").status_code == 404
+
+    # The GTIN-14 form of the same barcode finds the same offers
+    for code in ("6001299015205", "06001299015205"):
+        response = client.get(f"/products/by-barcode/{code}")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["gtin"] == "6001299015205"
+        assert body["retailers"] == 2
+        assert [p["retailer"] for p in body["products"]] == ["Checkers", "Pick n Pay"]
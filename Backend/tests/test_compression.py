@@ -0,0 +1,71 @@
+import gzip
+
+import pytest
+
+import compression
+from compression import choose_encoding, encode_cached, encoded_etag
+from test_products import load, make_product
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0.5, br;q=0.2", "gzip"),
+    ("gzip;q=0", None),
+    ("*;q=0", None),
+    ("gzip;q=bogus", None),
+    ("GZIP ; q=1", "gzip"),
+])
+def test_choose_encoding_gzip(accept, expected):
+    assert choose_encoding(accept) == expected
+
+
+@pytest.mark.skipif(not compression.BROTLI_AVAILABLE, reason="brotli not installed")
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, br", "br"),
+    ("*", "br"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=0.1, gzip;q=0.9", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*;q=0.5, gzip;q=0.1", "br"),
+])
+def test_choose_encoding_br(accept, expected):
+    assert choose_encoding(accept) == expected
+
+
+def test_encoded_etag_suffix_per_encoding():
+    assert encoded_etag('"abc"', None) == '"abc"'
+    assert encoded_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert encoded_etag('"abc"', "br") == '"abc-br"'
+
+
+def test_encode_cached_compresses_once_and_skips_small_bodies():
+    body = b"x" * compression.COMPRESS_MIN_BYTES
+    encoded = {}
+    compressed, encoding = encode_cached(body, encoded, "gzip")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body
+    assert encode_cached(body, encoded, "gzip")[0] is compressed
+    assert encode_cached(b"small", {}, "gzip") == (b"small", None)
+
+
+def test_client_holding_the_gzip_etag_gets_304(main_module, client):
+    main = main_module
+    load(main, [make_product(main, f"Long product name number {i}", 10.0 + i) for i in range(40)])
+
+    response = client.get("/products", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    etag = response.headers["etag"]
+    assert etag.endswith('-gzip"')
+
+    plain = client.get("/products", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert encoded_etag(plain.headers["etag"], "gzip") == etag
+
+    for accept in ("gzip", "identity"):
+        revalidated = client.get("/products", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
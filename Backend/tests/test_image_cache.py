@@ -0,0 +1,53 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import image_proxy
+from image_cache import ImageCache
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * (200 * 1024)
+URL = "https://cdn.example/large.png"
+
+
+@pytest.fixture
+def upstream(main_module, tmp_path, monkeypatch):
+    """Image proxy with a fresh cache directory and a fake upstream host."""
+    fetches = []
+
+    def respond(request):
+        fetches.append(str(request.url))
+        return httpx.Response(200, content=PNG, headers={"content-type": "image/png"})
+
+    monkeypatch.setattr(image_proxy, "image_cache", ImageCache(directory=str(tmp_path)))
+    monkeypatch.setattr(image_proxy, "_client", httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    return fetches
+
+
+def test_missing_body_file_is_fetched_again(client, upstream):
+    first = client.get("/image", params={"url": URL})
+    assert first.status_code == 200 and first.content == PNG
+
+    entry = image_proxy.image_cache.lookup(URL)
+    os.remove(image_proxy.image_cache.body_path(entry.key))
+
+    again = client.get("/image", params={"url": URL})
+    assert again.status_code == 200 and again.content == PNG
+    assert len(upstream) == 2
+
+
+def test_rescan_enforces_the_budget_across_workers(tmp_path):
+    async def scenario():
+        # Two workers sharing one directory, each under budget on its own
+        a = ImageCache(directory=str(tmp_path), max_bytes=250 * 1024, rescan_seconds=0)
+        b = ImageCache(directory=str(tmp_path), max_bytes=250 * 1024, rescan_seconds=3600)
+        b.load()
+        await b.put("https://cdn.example/b.png", PNG, "image/png")
+        await a.put("https://cdn.example/a.png", PNG, "image/png")
+        return a
+
+    a = asyncio.run(scenario())
+    assert a.stats()["disk_bytes"] <= 250 * 1024
+    stored = [name for _, _, files in os.walk(tmp_path) for name in files if not name.endswith(".json")]
+    assert len(stored) == 1
@@ -0,0 +1,96 @@
+import json
+
+import mongomock
+import pytest
+
+import ingest
+import mongo
+
+
+def product(name, price=10.0):
+    return {"name": name, "price": price, "url": f"https://www.shoprite.co.za/p/{name}"}
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """Cleaned files under a temporary Backend/ and fresh collections."""
+    cleaned = tmp_path / "scraper_shoprite" / "cleaned"
+    cleaned.mkdir(parents=True)
+    monkeypatch.setattr(ingest, "BASE_PATH", str(tmp_path))
+    monkeypatch.setattr(ingest, "cleaned_files", lambda: sorted(str(p) for p in cleaned.glob("*.json")))
+    db = mongomock.MongoClient().db
+
+    def write(name, rows):
+        (cleaned / name).write_text(json.dumps(rows), encoding="utf-8")
+
+    def refresh():
+        return ingest.refresh_files(db.products, db.manifest, db.tombstones)
+
+    def live_names():
+        return sorted(doc["productName"] for doc in db.products.find())
+
+    return write, refresh, live_names, db
+
+
+def test_product_listed_by_another_file_is_not_tombstoned(catalog):
+    write, refresh, live_names, db = catalog
+    write("a.json", [product("Q"), product("P")])
+    write("b.json", [product("P")])
+    refresh()
+    assert live_names() == ["P", "Q"]
+
+    write("b.json", [])
+    report = refresh()
+    assert report["tombstoned"] == 0
+    assert live_names() == ["P", "Q"]
+
+    write("a.json", [product("Q")])
+    report = refresh()
+    assert report["tombstoned"] == 1
+    assert live_names() == ["Q"]
+    assert [doc["productName"] for doc in db.tombstones.find()] == ["P"]
+
+
+def test_deleted_file_only_tombstones_products_no_other_file_lists(catalog, tmp_path):
+    write, refresh, live_names, _ = catalog
+    write("a.json", [product("Q"), product("P")])
+    write("b.json", [product("P"), product("R")])
+    refresh()
+
+    (tmp_path / "scraper_shoprite" / "cleaned" / "b.json").unlink()
+    report = refresh()
+    assert report["tombstoned"] == 1
+    assert live_names() == ["P", "Q"]
+
+
+
+def test_older_run_does_not_tombstone_a_newer_runs_writes(catalog):
+    write, _, live_names, db = catalog
+    write("a.json", [product("P"), product("Q")])
+    files = ingest.cleaned_files()
+    older, newer = ingest.new_run_id(), ingest.new_run_id()
+    assert older < newer
+
+    # Two refreshes of the same file interleave: the newer run lands first
+    ingest.ingest_files(db.products, files, run_id=older)
+    ingest.ingest_files(db.products, files, run_id=newer)
+    for filepath in files:
+        assert ingest.tombstone_stale(db.products, db.tombstones, ingest.source_name(filepath), older) == 0
+    assert live_names() == ["P", "Q"]
+
+
+def test_ingest_lease_is_exclusive_until_it_expires():
+    store = mongo.ProductStore(mongomock.MongoClient().db, "products")
+    assert store.acquire_lease("a", seconds=60)
+    assert not store.acquire_lease("b", seconds=60)
+    # The holder may extend its own lease
+    assert store.acquire_lease("a", seconds=60)
+    with pytest.raises(mongo.LeaseHeld):
+        with store.ingest_lease():
+            pass
+
+    # A crashed holder's lease is taken over once it has expired
+    assert store.acquire_lease("a", seconds=-1)
+    with store.ingest_lease():
+        assert not store.acquire_lease("a", seconds=60)
+    assert store.acquire_lease("b", seconds=60)
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import json_stream
+from json_stream import iter_json_records
+
+RECORDS = [
+    {"name": "Milk", "price": "R19.99", "n": [0, 1]},
+    {"productName": "Bread", "tags": ["bakery", "fresh"], "variants": [{"size": "700g"}]},
+    {"title": "Eggs", "price": 54.99},
+]
+
+
+def write(tmp_path, text, name="data.json"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 64 * 1024])
+@pytest.mark.parametrize("layout", ["array", "wrapped", "jsonl", "jsonl_wrapped"])
+def test_layouts_yield_records_unchanged(tmp_path, monkeypatch, chunk_size, layout):
+    monkeypatch.setattr(json_stream, "CHUNK_SIZE", chunk_size)
+    if layout == "array":
+        text = json.dumps(RECORDS, indent=2)
+    elif layout == "wrapped":
+        text = json.dumps({"picknpay": RECORDS[:2], "meta": {"pages": 2}, "more": RECORDS[2:]}, indent=2)
+    elif layout == "jsonl":
+        text = "\n".join(json.dumps(record) for record in RECORDS) + "\n"
+    else:
+        text = json.dumps({"picknpay": RECORDS}) + "\n"
+    assert list(iter_json_records(write(tmp_path, text))) == RECORDS
+
+
+def test_jsonl_record_with_list_field_is_not_unwrapped(tmp_path):
+    path = write(tmp_path, '{"name": "x", "n": [0, 1]}\n{"name": "y", "n": []}\n')
+    assert list(iter_json_records(path)) == [{"name": "x", "n": [0, 1]}, {"name": "y", "n": []}]
+
+
+def test_jsonl_object_without_record_lists_is_a_record(tmp_path):
+    path = write(tmp_path, '{"sku": "1", "sizes": ["S", "M"]}\n')
+    assert list(iter_json_records(path)) == [{"sku": "1", "sizes": ["S", "M"]}]
@@ -0,0 +1,63 @@
+import glob
+
+import ingest
+from matching import find_groups, variant_conflict
+
+
+def offer(doc_id, retailer, name, gtin=None):
+    return {"_id": doc_id, "retailer": retailer, "productName": name, "gtin": gtin}
+
+
+def grouped(groups, a, b):
+    return a in groups and groups.get(a) == groups.get(b)
+
+
+def test_battery_sizes_are_not_matched():
+    groups = find_groups([
+        offer("ck", "Checkers", "Energizer MAX AAA Alkaline Batteries 12-Pack"),
+        offer("ww", "Woolworths", "Energizer MAX AA Alkaline Batteries 12 pk"),
+        offer("pnp", "Pick n Pay", "Energizer Max AAA 12 Pack"),
+    ])
+    assert grouped(groups, "ck", "pnp")
+    assert "ww" not in groups
+
+
+def test_flavour_variants_are_not_matched():
+    groups = find_groups([
+        offer("pnp", "Pick n Pay", "Colgate Triple Action Multibenefit Toothpaste 100ml"),
+        offer("sr", "Shoprite", "Colgate Triple Action Original Mint Fluoride Toothpaste 100ml"),
+    ])
+    assert groups == {}
+
+
+def test_same_product_with_extra_descriptive_words_still_matches():
+    groups = find_groups([
+        offer("ck", "Checkers", "Sunlight Original Dishwashing Liquid 750ml"),
+        offer("ww", "Woolworths", "Sunlight Dishwashing Liquid 750 ml"),
+    ])
+    assert grouped(groups, "ck", "ww")
+
+
+def test_variant_conflict():
+    assert variant_conflict(["energizer", "aa"], ["energizer", "aaa"])
+    assert variant_conflict(["colgate", "multibenefit"], ["colgate", "original", "mint"])
+    assert not variant_conflict(["sunlight", "original"], ["sunlight"])
+
+
+def test_cleaned_catalog_energizer_groups():
+    products = []
+    for filepath in glob.glob(ingest.CLEANED_GLOB):
+        retailer = ingest.retailer_from_path(filepath)
+        for item in ingest.iter_json_records(filepath):
+            doc = ingest.normalize_product(item, retailer)
+            if doc:
+                products.append(doc)
+    groups = find_groups(products)
+
+    def group_of(name):
+        return next(groups.get(p["_id"]) for p in products if p["productName"] == name)
+
+    checkers_aaa = group_of("Energizer MAX AAA Alkaline Batteries 12-Pack")
+    assert checkers_aaa is not None
+    assert checkers_aaa == group_of("Energizer Max AAA 12 Pack")
+    assert group_of("Energizer MAX AA Alkaline Batteries 12 pk") != checkers_aaa
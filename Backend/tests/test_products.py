@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+import time
+from typing import List
+
+import pytest
+
+from bson import json_util
+from pydantic import TypeAdapter
+
+
+def make_product(main, name, price, retailer="Checkers", category="Food", **extra):
+    doc = {
+        "productName": name,
+        "price": price,
+        "productImageURL": f"https://img.example/{name.replace(' ', '-')}.png",
+        "productURL": f"https://shop.example/{name.replace(' ', '-')}",
+        "category": category,
+        "retailer": retailer,
+        **extra,
+    }
+    doc.update(main.ingest.derived_fields(doc))
+    doc["_id"] = main.ingest.product_key(doc)
+    return doc
+
+
+def load(main, docs):
+    main.store.products.insert_many(docs)
+    main.rebuild_search_index()
+    main.store.bump_version()
+
+
+def test_search_cursor_pages_stay_within_matches_past_unpriced_boundary(main_module, client):
+    main = main_module
+    docs = [make_product(main, f"Widget {i}", price) for i, price in enumerate((10.0, None, None))]
+    docs += [make_product(main, f"Gadget {i}", None) for i in range(5)]
+    docs += [make_product(main, f"Gadget priced {i}", 5.0 + i) for i in range(2)]
+    load(main, docs)
+
+    expected = [p["productName"] for p in client.get("/products", params={"search": "widget"}).json()]
+    assert sorted(expected) == ["Widget 0", "Widget 1", "Widget 2"]
+
+    seen, cursor = [], None
+    for _ in range(10):
+        params = {"search": "widget", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/products", params=params)
+        assert response.status_code == 200
+        seen += [p["productName"] for p in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+
+
+def test_startup_indexes_the_live_generation(main_module):
+    main = main_module
+    generation = main.store.new_generation()
+    main.store.promote(generation)
+    # A restarted worker imports with the base collection as its default
+    main.store.active = main.store.base_name
+
+    asyncio.run(main.startup_event())
+
+    assert main.store.active == generation
+    indexes = main.store.products.index_information()
+    for name in ("retailer_key_1_price_1__id_1", "matchGroup_1_price_1", "gtin_1_price_1", "imageId_1"):
+        assert name in indexes
+
+
+def test_pages_cached_before_the_search_index_swap_are_not_served_after(main_module, client):
+    main = main_module
+    load(main, [make_product(main, "Apple juice", 20.0)])
+
+    # Another worker ingested a product: the version moves before this
+    # worker's search index is rebuilt
+    main.store.products.insert_one(make_product(main, "Zebra crackers", 30.0))
+    main.store.bump_version()
+    assert client.get("/products", params={"search": "zebra"}).json() == []
+
+    main.rebuild_search_index()
+    names = [p["productName"] for p in client.get("/products", params={"search": "zebra"}).json()]
+    assert names == ["Zebra crackers"]
+
+
+def test_serialize_products_matches_product_out(main_module):
+    main = main_module
+    docs = [
+        make_product(main, "Milk 1L", 19.99, matchGroup="g1", gtin="6001299015205", sku="10156109PK1"),
+        make_product(main, "Bread", None),
+        make_product(main, "Eggs", 55),
+        {"_id": "legacy:1", "productName": "Legacy", "price": "12.50", "productImageURL": "https://img.example/a b.png"},
+        {"_id": "legacy:2", "productName": "Bare"},
+    ]
+    # The lean path only differs from the model by design in the image URL,
+    # which points at the /image proxy
+    expected = TypeAdapter(List[main.ProductOut]).dump_json(
+        TypeAdapter(List[main.ProductOut]).validate_python(
+            [{**doc, "productImageURL": main.image_proxy_url(doc)} for doc in docs]
+        ),
+        by_alias=True,
+    )
+    lean = main.serialize_products(docs)
+    assert json.loads(lean) == json.loads(expected)
+    # Same key order as the model, too
+    assert [list(row) for row in json.loads(lean)] == [list(row) for row in json.loads(expected)]
+
+
+def test_home_bundle_outlives_response_cache_ttl_and_eviction(main_module, client, monkeypatch):
+    main = main_module
+    load(main, [make_product(main, "Milk 1L", 19.99)])
+    builds = []
+    build = main.build_home_bundle
+    monkeypatch.setattr(main, "build_home_bundle", lambda: builds.append(1) or build())
+
+    asyncio.run(main.warm_home())
+    assert client.get("/home").status_code == 200
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10 * main.products_cache.ttl)
+    for i in range(main.products_cache.max_entries + 1):
+        client.get("/products", params={"skip": i})
+    assert client.get("/home").status_code == 200
+    assert len(builds) == 1
+
+    main.store.bump_version()
+    assert client.get("/home").json()["catalog_version"] == main.store.version
+    assert len(builds) == 2
+
+
+def test_search_without_searchable_terms_matches_nothing(main_module, client):
+    main = main_module
+    load(main, [make_product(main, "Milk 1L", 19.99), make_product(main, "Bread", None)])
+
+    assert len(client.get("/products").json()) == 2
+    for search in ("!!!", "&", "-"):
+        assert client.get("/products", params={"search": search}).json() == []
+        facets = client.get("/facets", params={"search": search}).json()
+        assert facets["total"] == 0
+
+
+def cursor_token(payload):
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_values_must_be_plain_price_and_id(main_module, client):
+    main = main_module
+    load(main, [make_product(main, "Milk 1L", 19.99)])
+    for payload in (
+        {"p": {"$ne": None}, "i": "x", "d": 0},
+        {"p": 10.0, "i": {"$gt": ""}, "d": 0},
+        {"p": True, "i": "x", "d": 0},
+        {"p": "10", "i": "x", "d": 0},
+    ):
+        response = client.get("/products", params={"cursor": cursor_token(payload)})
+        assert response.status_code == 400
+    for payload in ({"p": 10.0, "i": "x", "d": 0}, {"p": None, "i": "x", "d": 0}):
+        assert client.get("/products", params={"cursor": cursor_token(payload)}).status_code == 200
+
+
+def test_catalog_writes_wait_for_another_workers_lease(main_module, client):
+    main = main_module
+    assert main.store.acquire_lease("other-worker", seconds=60)
+    try:
+        with pytest.raises(main.mongo.LeaseHeld):
+            main.seed_database_from_json()
+        assert client.post("/debug/reseed", params={"full": "false"}).status_code == 409
+        assert client.post("/debug/reseed").status_code == 409
+        assert client.post("/debug/rollback").status_code == 409
+    finally:
+        main.store.release_lease("other-worker")
+
+
+def test_baseline_single_field_indexes_are_dropped(main_module):
+    main = main_module
+    collection = main.store.products
+    for field in ("name", "retailer", "category"):
+        collection.create_index(field)
+    main.ensure_product_indexes(collection)
+    indexes = collection.index_information()
+    assert not set(main.LEGACY_INDEXES) & set(indexes)
+    assert "retailer_key_1_category_key_1_price_1__id_1" in indexes
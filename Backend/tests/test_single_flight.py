@@ -0,0 +1,42 @@
+import asyncio
+
+from response_cache import CachedResponse, ResponseCache
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_task():
+    stats = {"coalesced": 0}
+    flights = SingleFlight(stats)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        results = await asyncio.gather(*(flights.run("k", work) for _ in range(3)))
+        assert "k" not in flights
+        return results
+
+    assert asyncio.run(main()) == [1, 1, 1]
+    assert stats["coalesced"] == 2
+
+
+def test_response_cache_computes_a_miss_once():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return CachedResponse(body=b"page")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute(1, "page", compute) for _ in range(3)))
+
+    assert [entry.body for entry in asyncio.run(main())] == [b"page"] * 3
+    assert len(calls) == 1
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] == 2
+    assert asyncio.run(cache.get_or_compute(1, "page", compute)).body == b"page"
+    assert cache.stats["hits"] == 1